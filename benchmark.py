@@ -0,0 +1,220 @@
+import os
+import sys
+import shutil
+import platform
+import subprocess
+import tempfile
+from argparse import ArgumentParser
+from contextlib import redirect_stdout
+from json import load, dump
+from time import time
+import numpy as np
+from PIL import Image
+import bricks
+import packing
+
+# synthetic terrains, see generateTerrain
+TERRAINS = ("plains", "hills", "cliffs", "roads", "mosaic")
+SIZES = (256, 1024)
+STAGES = ("conversion", "quantization", "placement", "walls", "trees", "output")
+
+
+def noise(size: int, rng: np.random.Generator, cells: int) -> np.ndarray:
+    """
+    Smooth random terrain between 0 and 1.
+
+    :param size: edge length of the terrain
+    :param rng: random generator
+    :param cells: number of random values along one edge, fewer values give smoother terrain
+    """
+    coarse = rng.random((cells + 1, cells + 1))
+    position = np.linspace(0, cells, size, endpoint=False)
+    index = position.astype(int)
+    fraction = position - index
+    # bilinear interpolation between the random values
+    rows = coarse[index] * (1 - fraction)[:, None] + coarse[index + 1] * fraction[:, None]
+    return rows[:, index] * (1 - fraction)[None, :] + rows[:, index + 1] * fraction[None, :]
+
+
+def generateTerrain(terrain: str, size: int, zStepSize: int, rng: np.random.Generator) -> (np.ndarray, np.ndarray):
+    """
+    :param terrain: one of TERRAINS
+    :param size: edge length of the maps
+    :param zStepSize: vertical interval of the bricks in heightMap depth
+    :param rng: random generator
+    :return: height map (uint16) and index of the material (see benchmarkMaterials) of every cell
+    """
+    materialGrid = np.zeros((size, size), np.uint8)
+    if terrain == "plains":
+        heights = np.full((size, size), 10 * zStepSize) + (noise(size, rng, 4) * 2 * zStepSize).astype(int)
+    elif terrain == "hills":
+        heights = (noise(size, rng, max(size // 32, 2)) * 60 * zStepSize).astype(int)
+    elif terrain == "cliffs":
+        heights = (noise(size, rng, max(size // 64, 2)) * 8).astype(int) * 20 * zStepSize
+    elif terrain == "roads":
+        heights = (noise(size, rng, max(size // 64, 2)) * 30 * zStepSize).astype(int)
+        roads = np.zeros(size, bool)
+        for start in range(16, size, 64):
+            roads[start:start + 6] = True
+        materialGrid[roads, :] = 2
+        materialGrid[:, roads] = 2
+    elif terrain == "mosaic":
+        heights = (noise(size, rng, max(size // 32, 2)) * 40 * zStepSize).astype(int)
+        blocks = rng.integers(0, 16, (size // 8 + 1, size // 8 + 1))
+        materialGrid = np.kron(blocks, np.ones((8, 8), int))[:size, :size].astype(np.uint8)
+    else:
+        raise ValueError(f"unknown terrain {terrain}, use one of {TERRAINS}")
+    return heights.astype(np.uint16), materialGrid
+
+
+def benchmarkMaterials(baseConfigPath: str, directory: str) -> [str]:
+    """
+    Writes 16 materials derived from one material config: the config itself with a new color, a flat and a road
+    version and 13 more colors of the three. Every brick gets a unique name, so all of them write their own output.
+
+    :param baseConfigPath: path of a material config like materials/exampleMaterial.json
+    :param directory: folder for the written configs
+    :return: paths of the configs, the index of a path is the material index used by generateTerrain
+    """
+    with open(baseConfigPath) as file:
+        base = load(file)
+    paths = []
+    for i in range(16):
+        kind = ("slope", "flat", "road")[i % 3]
+        data = dict(base)
+        data["color"] = [i * 16, 255 - i * 16, (i * 97) % 256]
+        data["type"] = base.get("type", "flat") if kind == "slope" else kind
+        data["bricks"] = [dict(brick, name=f'{brick["name"]}_{i}',
+                               **({} if kind == "slope" else {"type": kind})) for brick in base["bricks"]]
+        data["wallBricks"] = [dict(brick, name=f'{brick["name"]}_{i}') for brick in base.get("wallBricks", [])]
+        path = os.path.join(directory, f'benchmarkMaterial{i}.json')
+        with open(path, "w") as file:
+            dump(data, file)
+        paths.append(path)
+    return paths
+
+
+def treeConfigs(materialPaths: [str]) -> [dict]:
+    """
+    :return: one tree type per material with its color, the normal bricks of the material are used as trees
+    """
+    configs = []
+    for i, path in enumerate(materialPaths):
+        with open(path) as file:
+            data = load(file)
+        configs.append({"name": f'trees{i}', "color": data["color"], "density": [8, 8],
+                        "objects": [dict(brick, name=f'tree_{brick["name"]}', type="tree")
+                                    for brick in data["bricks"]]})
+    return configs
+
+
+def gitCommit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ""
+
+
+def runBenchmark(terrain: str, size: int, baseConfigPath: str, zStepSize: int, worldScale: [float, float, float],
+                 randomSeed: int = 0, roadSmoothing: int = 0, packingMode: str = "greedy") -> dict:
+    """
+    Generates one synthetic world and runs every stage of main.py on it.
+
+    :param roadSmoothing: radius of the road smoothing of the quantization stage, see preprocessHeights
+    :param packingMode: one of packing.PACKING_MODES
+
+    :return: dictionary with the time of every stage in seconds and the number of placed instances
+    """
+    from main import convertToMaterial, placeBricks, placeWallBricks, placeTrees, saveJsons
+    from preprocessing import roadMask, brickHeadroom, preprocessHeights
+    from materials import material
+    from trees import treeType
+    from randomness import sharedRandom
+    from maps import readHeightMap
+    from placements import sharedPlacements
+    from rotations import sharedRotations, sharedRoadSlopes
+    from instrumentation import sharedProfiler
+    from configs import sharedConfigs
+
+    # the shared stores and caches are emptied, so a run doesn't measure the instances and entries of earlier runs
+    for shared in (sharedPlacements, sharedRotations, sharedRoadSlopes, sharedProfiler, sharedConfigs):
+        shared.clear()
+
+    directory = tempfile.mkdtemp(prefix="brickBenchmark")
+    try:
+        materialPaths = benchmarkMaterials(baseConfigPath, directory)
+        heights, materialIndexes = generateTerrain(terrain, size, zStepSize, np.random.default_rng(randomSeed))
+        colors = np.array([load(open(path))["color"] for path in materialPaths], np.uint8)
+        Image.fromarray(heights).save(os.path.join(directory, "height.png"))
+        Image.fromarray(colors[materialIndexes]).save(os.path.join(directory, "texture.png"))
+
+        bricks.outputDirectory = os.path.join(directory, "jsonsOutput")
+        packing.packingMode = packingMode
+        with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+            materials = [material(path) for path in materialPaths]
+            treeTypes = [treeType(data) for data in treeConfigs(materialPaths)]
+        worldScale = [worldScale[0], worldScale[1], worldScale[2] / zStepSize]
+        worldOffset = [-size / 2, -size / 2, 0]
+        sharedRandom.configure(randomSeed)
+        times = {}
+
+        def stage(name: str, function, *args):
+            startTimer = time()
+            with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+                result = function(*args)
+            times[name] = time() - startTimer
+            return result
+
+        displacementGrid, materialGrid = stage("conversion", lambda: (
+            readHeightMap(os.path.join(directory, "height.png")),
+            convertToMaterial(os.path.join(directory, "texture.png"), materials)))
+        displacementGrid = stage("quantization", lambda: preprocessHeights(
+            displacementGrid, roadMask(materialGrid, materials), zStepSize, roadSmoothing,
+            headroom=brickHeadroom(materials, zStepSize)))
+        brickHeightGrid = stage("placement", placeBricks, displacementGrid, materialGrid, materials, worldScale,
+                                worldOffset, zStepSize)
+        stage("walls", lambda: [placeWallBricks(displacementGrid, brickHeightGrid, displacementGrid.shape, worldScale,
+                                                worldOffset, zStepSize, materialGrid, materials, LOCALXAXIS)
+                                for LOCALXAXIS in (False, True)])
+        stage("trees", placeTrees, brickHeightGrid, materialGrid, treeTypes, worldScale, worldOffset,
+              roadMask(materialGrid, materials), randomSeed)
+        stage("output", saveJsons, materials, treeTypes)
+
+        instances = sum(brick.placedBricks for mat in materials for brick in mat.builtBrickList())
+        treeInstances = sum(tree.placedBricks for trees in treeTypes for tree in trees.trees)
+        return {"terrain": terrain, "size": size, "packing": packingMode, "stages": times, "total": sum(times.values()),
+                "instances": instances, "trees": treeInstances}
+    finally:
+        bricks.outputDirectory = "jsonsOutput"
+        packing.packingMode = "greedy"
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description="Times every stage of the generation on synthetic worlds.")
+    parser.add_argument("--terrains", nargs="+", default=TERRAINS, choices=TERRAINS)
+    parser.add_argument("--sizes", nargs="+", type=int, default=SIZES, help="edge lengths of the worlds, e.g. 256 8192")
+    parser.add_argument("--material", default="materials/exampleMaterial.json",
+                        help="material config the materials of the worlds are derived from")
+    parser.add_argument("--stepSize", type=int, default=32)
+    parser.add_argument("--worldscale", nargs=3, type=float, default=[0.25, 0.25, 0.1])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--roadSmoothing", type=int, default=0)
+    parser.add_argument("--packing", default="greedy", choices=packing.PACKING_MODES)
+    parser.add_argument("--output", default="benchmark.json", help="path of the json file with the results")
+    arguments = parser.parse_args()
+
+    results = []
+    for size in arguments.sizes:
+        for terrain in arguments.terrains:
+            result = runBenchmark(terrain, size, arguments.material, arguments.stepSize, arguments.worldscale,
+                                  arguments.seed, arguments.roadSmoothing, arguments.packing)
+            print(f'{terrain} {size}x{size}: {round(result["total"], 2)} sec., '
+                  + ", ".join(f'{name} {round(result["stages"][name], 2)}' for name in STAGES))
+            results.append(result)
+
+    with open(arguments.output, "w") as file:
+        dump({"commit": gitCommit(), "python": sys.version.split()[0], "platform": platform.platform(),
+              "numpy": np.__version__, "seed": arguments.seed, "results": results}, file, indent=2)
+    print(f"results written to {arguments.output}")
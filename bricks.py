@@ -1,7 +1,18 @@
 import math
 import numpy as np
-import os
-from random import randrange
+from output import instanceSink
+from rotations import sharedRotations, sharedRoadSlopes
+from placements import sharedPlacements
+from randomness import sharedRandom, streamId
+from lod import sharedLod
+from instrumentation import sharedProfiler
+
+# folder in which every brick creates its own folder with an items.level.json
+outputDirectory = "jsonsOutput"
+# formats the bricks are written in, see output.OUTPUT_FORMATS
+outputFormats = ("json",)
+# compression of the items.level.json files, None or one of output.COMPRESSIONS
+outputCompression = None
 
 
 class brick:
@@ -23,6 +34,8 @@ class brick:
         self.persistentID = data["persistentID"]
         # name of the object in BeamNG
         self.name = data["name"]
+        # id of the brick in the counters of the random draws, see randomness.placementRandom
+        self.stream = streamId(self.name)
         self.randomZRotation = data.get("randomZRotation", False)
         # File to linked DAE-file containing the mesh of this brick
         # main mesh of object
@@ -31,17 +44,15 @@ class brick:
             raise ReferenceError(f'linkedObject of brick {self.name} is not a list but a'
                                  f' {type(self.linkedObject)}. \n Change the {type(self.linkedObject)} to a'
                                  f' list in the corresponding material.json.')
-        # output json-file
-        path = r'jsonsOutput/' + self.name
-        if not os.path.exists(path):
-            os.makedirs(path)
-        self.outFile = open(("jsonsOutput/" + self.name + "/items.level.json"), "w")
+        # output json-file, only created when the first instance is written
+        self.sink = instanceSink(outputDirectory + '/' + self.name + "/items.level.json", self.name,
+                                 formats=outputFormats, compression=outputCompression)
         self.rotation = 0
         self.placedBricks = 0
 
     def placeInstance(self, coordinates: [int, int, int], worldscale: [float, float, float],
                       rotation: [float, float, float],
-                      linkedFile: str, scale: [float, float, float] = [1, 1, 1]):
+                      linkedFile: str, scale: [float, float, float] = [1, 1, 1], offset: [float, float, float] = None):
         """
         Functions places an instance of the linked mesh in the Json-File for BeamNG.
 
@@ -50,51 +61,66 @@ class brick:
         :param rotation: rotation in around all axis (x,y,z) in radians
         :param linkedFile: string of the filepath to the DAE-File
         :param scale: scale of the object
+        :param offset: offset of the mesh. Default: the offset of the brick, swapped if rotateOffset and the brick is
+         rotated by 90 or 270 degrees
         :return: none
         """
-
-        def rotationMatrix() -> np.matrix:
-            # X-rotation
-            matrix = np.matrix([[1, 0, 0],
-                                [0, math.cos(rotation[0]), -math.sin(rotation[0])],
-                                [0, math.sin(rotation[0]), math.cos(rotation[0])]])
-            # Y-rotation
-            matrix *= np.matrix([[math.cos(rotation[1]), 0, math.sin(rotation[1])],
-                                 [0, 1, 0],
-                                 [-math.sin(rotation[1]), 0, math.cos(rotation[1])]])
-            # Z-rotation
-            matrix *= np.matrix([[math.cos(rotation[2]), -math.sin(rotation[2]), 0],
-                                 [math.sin(rotation[2]), math.cos(rotation[2]), 0],
-                                 [0, 0, 1]])
-            matrix[abs(matrix) < 1e-8] = 0
-            matrix[matrix > 1 - 1e-8] = 1
-            matrix[matrix < -1 + 1e-8] = -1
-            return matrix
-
-        matrix = rotationMatrix()
-        offset = ((self.offset[1], self.offset[0], self.offset[2]) if rotation[2] % math.radians(180) != math.radians(
-            90) else self.offset) if self.rotateOffset else self.offset
+        self.placedBricks += 1
+        # instances of far cells are replaced by the boxes of the lod stage
+        if sharedLod.enabled and sharedLod.isFar(coordinates):
+            sharedProfiler.count("lodHiddenInstances")
+            return
+        if offset is None:
+            offset = ((self.offset[1], self.offset[0], self.offset[2]) if rotation[2] % math.radians(180) !=
+                      math.radians(90) else self.offset) if self.rotateOffset else self.offset
         # oldcode: np.array(self.offset * matrix)[0]
         position = [round((coordinates[0] + offset[0]) * worldscale[0], 3),
                     round((coordinates[1] + offset[1]) * worldscale[1], 3),
                     round((coordinates[2] + offset[2]) * worldscale[2], 4)]
-        text = '{' + f'"class":"TSStatic","__parent":"{self.name}",' \
-                     f'"position":{position},"isRenderEnabled":false,'
         # deleted: "persistentId":"{self.persistentID}",
+        scaleText = ''
         if any(i != 1 for i in scale) or any(i != 1 for i in self.scale):
-            text += f'"scale":[{self.scale[0] * scale[0]},' \
-                    f'{self.scale[1] * scale[1]},' \
-                    f'{self.scale[2] * scale[2]}],'
-        if any(i != 0 for i in rotation):
-            text += f'"rotationMatrix":[{matrix[0, 0]},{matrix[0, 1]},{matrix[0, 2]},' \
-                    f'{matrix[1, 0]},{matrix[1, 1]},{matrix[1, 2]},' \
-                    f'{matrix[2, 0]},{matrix[2, 1]},{matrix[2, 2]}],'
-        text += f'"shapeName":"{linkedFile}","useInstanceRenderData":true' + '}\n'
-        self.outFile.write(text)
-        self.placedBricks += 1
+            scaleText = f'"scale":[{self.scale[0] * scale[0]},' \
+                        f'{self.scale[1] * scale[1]},' \
+                        f'{self.scale[2] * scale[2]}],'
+        self.sink.add(position, sharedRotations.text(rotation), scaleText, linkedFile)
+
+    def placeInstances(self, coordinates: [[float, float, float]], worldscale: [float, float, float],
+                       rotations: [[float, float, float]], linkedFiles: [str]):
+        """
+        Same as placeInstance for many unscaled instances at once.
+
+        :param coordinates: coordinates of all instances
+        :param worldscale: scale of the world: one brick unit equals world scale in meters
+        :param rotations: rotation of every instance around all axis (x,y,z) in radians
+        :param linkedFiles: filepath to the DAE-File of every instance
+        :return: none
+        """
+        self.placedBricks += len(coordinates)
+        if sharedLod.enabled:
+            near = ~sharedLod.farMask(coordinates)
+            sharedProfiler.count("lodHiddenInstances", int(len(coordinates) - near.sum()))
+            coordinates = [coordinate for coordinate, keep in zip(coordinates, near.tolist()) if keep]
+            rotations = [rotation for rotation, keep in zip(rotations, near.tolist()) if keep]
+            linkedFiles = [linkedFile for linkedFile, keep in zip(linkedFiles, near.tolist()) if keep]
+        positions, rotationTexts = [], []
+        # heights are rounded by numpy, like the numpy heights in placeInstance
+        heights = np.round((np.array([coordinate[2] for coordinate in coordinates], np.float64) + self.offset[2])
+                           * worldscale[2], 4).tolist()
+        for coordinate, rotation, height in zip(coordinates, rotations, heights):
+            offset = ((self.offset[1], self.offset[0], self.offset[2]) if rotation[2] % math.radians(180) != math.radians(
+                90) else self.offset) if self.rotateOffset else self.offset
+            positions.append((round((coordinate[0] + offset[0]) * worldscale[0], 3),
+                              round((coordinate[1] + offset[1]) * worldscale[1], 3),
+                              height))
+            rotationTexts.append(sharedRotations.text(rotation))
+        scaleText = ''
+        if any(i != 1 for i in self.scale):
+            scaleText = f'"scale":[{self.scale[0] * 1},{self.scale[1] * 1},{self.scale[2] * 1}],'
+        self.sink.addMany(positions, rotationTexts, [scaleText] * len(positions), linkedFiles)
 
     def closeJson(self):
-        self.outFile.close()
+        self.sink.close()
 
 
 class normalBrick(brick):
@@ -108,17 +134,22 @@ class normalBrick(brick):
             raise ReferenceError(f'linkedFlatObject of brick {self.name} is not a list but a'
                                  f' {type(self.linkedFlatObject)}. \n Change the {type(self.linkedFlatObject)} to a'
                                  f' list in the corresponding material.json.')
-        brickType = data.get("type", "flat")
+        self.brickType = data.get("type", "flat")
         types = {"flat": self.brickFlatTest, "road": self.brickRoadTest, "slope": self.brickSlopeTest, "tree": self.treeTest}
-        self.objectType = types[brickType]
+        self.objectType = types[self.brickType]
         self.minSlope = data.get("minSlope", 0)
-        self.slopeX, self.slopeY = 0, 0
+        # bricks with a higher priority are tested first, by default the position in the material (see material)
+        self.priority = data.get("priority")
+        # cost of one instance for the cost packing, see packing.packBricks
+        self.cost = data.get("cost", 1)
         self.placedFlatBricks = 0
         self.placedEdgeBricks = 0
+        # number of times the brick was tested
+        self.triedBricks = 0
 
     def brickTest(self, coordinates: (int, int), worldSize: (int, int), height: int, materialIndex: int,
-                  displacementGrid: [[int]], materialGrid: [[int]], finishedGrid: [[bool]], testedGrid: [[bool]]) \
-            -> bool:
+                  displacementGrid: [[int]], materialGrid: [[int]], finishedGrid: [[bool]], runs: dict,
+                  materialTypes: np.ndarray, slope: (int, int) = (0, 0)) -> bool:
         """
             This Functions tests if the brick can be placed on the given Coordinates.
 
@@ -129,15 +160,17 @@ class normalBrick(brick):
             :param displacementGrid: Grid that stores the height of the terrain
             :param materialGrid: Grid that stores the material indexes of the terrain
             :param finishedGrid: Grid that stores if a brick is already placed on these Coordinates
-            :param testedGrid: Grid that stores if the position is already tested
+            :param runs: scratch lists of the material for every kind of footprint test, see footprintTest
+            :param materialTypes: type of every material, indexed by the material indexes
+            :param slope: slope of the road in x and y direction at the coordinates, see fitting.roadSlopes
             :return: True if brick can be placed, False if not
             """
         return self.objectType(coordinates, worldSize, height, materialIndex, displacementGrid, materialGrid,
-                               finishedGrid, testedGrid)
+                               finishedGrid, runs, materialTypes, slope)
 
     def brickSlopeTest(self, coordinates: (int, int), worldSize: (int, int), height: int, materialIndex: int,
-                      displacementGrid: [[int]], materialGrid: [[int]], finishedGrid: [[bool]], testedGrid: [[bool]])\
-            -> bool:
+                      displacementGrid: [[int]], materialGrid: [[int]], finishedGrid: [[bool]], runs: dict,
+                      materialTypes: np.ndarray, slope: (int, int) = (0, 0)) -> bool:
 
         x = coordinates[0] + 1
         slopePositivX = (displacementGrid[x][coordinates[1]] - height) if x < worldSize[0] else 0
@@ -148,156 +181,92 @@ class normalBrick(brick):
         y = coordinates[1] - 1
         slopeNegativY = (height - displacementGrid[coordinates[0]][y]) if y < worldSize[1] else 0
 
-        self.slopeX = slopePositivX if slopePositivX >= 0 else (slopeNegativX if slopeNegativX <= 0 else 0)
-        self.slopeY = slopePositivY if slopePositivY >= 0 else (slopeNegativY if slopeNegativY <= 0 else 0)
+        slopeX = slopePositivX if slopePositivX >= 0 else (slopeNegativX if slopeNegativX <= 0 else 0)
+        slopeY = slopePositivY if slopePositivY >= 0 else (slopeNegativY if slopeNegativY <= 0 else 0)
 
-        if abs(self.slopeX) > abs(self.slopeY):
-            if self.minSlope <= self.slopeX:
+        if abs(slopeX) > abs(slopeY):
+            if self.minSlope <= slopeX:
                 self.rotation = 0
                 return True
-            elif self.minSlope <= -self.slopeX:
+            elif self.minSlope <= -slopeX:
                 self.rotation = 180
                 return True
         else:
-            if self.minSlope <= self.slopeY:
+            if self.minSlope <= slopeY:
                 self.rotation = 270
                 return True
-            elif self.minSlope <= -self.slopeY:
+            elif self.minSlope <= -slopeY:
                 self.rotation = 90
                 return True
         return False
 
     def brickRoadTest(self, coordinates: (int, int), worldSize: (int, int), height: int, materialIndex: int,
-                      displacementGrid: [[int]], materialGrid: [[int]], finishedGrid: [[bool]], testedGrid: [[bool]])\
-            -> bool:
-        def test(first: int, second: int):
-            for deltaX in range(self.size[first]):
-                for deltaY in range(self.size[second]):
-                    if not testedGrid[deltaX, deltaY]:
-                        X = coordinates[0] + deltaX
-                        if X >= worldSize[0]:
-                            return False
-                        Y = coordinates[1] + deltaY
-                        if Y >= worldSize[1]:
-                            return False
-                        if height + self.slopeX * deltaX + self.slopeY * deltaY != displacementGrid[X][Y] or finishedGrid[X,Y] or materialIndex != materialGrid[X][Y]:
-                            return False
-                        else:
-                            testedGrid[deltaX,deltaY] = True
-            return True
-        
-        self.slope(height, coordinates, worldSize, displacementGrid, materialGrid)
-        
-        if test(0, 1):
-            return True
-        return False
-
-    def slope(self, height: int, coordinates: [int, int], worldSize: [int, int], displacementGrid: [[int]],
-              materialGrid, materialType="road"):
-
-        self.slopeX, self.slopeY = 0, 0
-
-        # Checking X-Slope
-        def secondX():
-            # If not, is new X in world bounds?
-            X = coordinates[0] - 1
-            if X >= 0:
-                # Is new positions same material?
-                if materialGrid[X][coordinates[1]].materialType == materialType:
-                    self.slopeX = height - displacementGrid[X][coordinates[1]]
-
-        X = coordinates[0] + 1
-        # is X in world bounds?
-        if X < worldSize[0]:
-            # If not, is new positions the same material?
-            if materialGrid[X][coordinates[1]].materialType == materialType:
-                self.slopeX = displacementGrid[X][coordinates[1]] - height
-            else:
-                secondX()
-        else:
-            secondX()
-
-        # Checking Y-Slope
-        def secondY():
-            # If not, is new Y in world bounds?
-            Y = coordinates[1] - 1
-            if Y >= 0:
-                # Is new positions same material?
-                if materialGrid[coordinates[0]][Y].materialType == materialType:
-                    self.slopeY = height - displacementGrid[coordinates[0]][Y]
-
-        Y = coordinates[1] + 1
-        # is Y in world bounds?
-        if Y < worldSize[1]:
-            # If not, is new positions the same material?
-            if materialGrid[coordinates[0]][Y].materialType == materialType:
-                self.slopeY = displacementGrid[coordinates[0]][Y] - height
-            else:
-                secondY()
-        else:
-            secondY()
-                
-        """# Checking Y-Slope (old Code)
-        Y = coordinates[1] + 1
-        # is X in world bounds?
-        if Y >= worldSize[0]:
-            self.slopeY = 0
-        else:
-            # If not, is new positions a road block as well?
-            if materialGrid[coordinates[0]][Y].materialType == materialType:
-                self.slopeY = displacementGrid[coordinates[0]][Y] - height
-            else:
-                # If not, is new Y in world bounds?
-                Y = coordinates[0] - 1
-                if Y < 0:
-                    self.slopeY = 0
-                elif materialGrid[coordinates[0]][Y].materialType == materialType:
-                    # If not, is new positions a road block as well?
-                    self.slopeY = height - displacementGrid[coordinates[0]][Y]
-                else:
-                    self.slopeY = 0"""
+                      displacementGrid: [[int]], materialGrid: [[int]], finishedGrid: [[bool]], runs: dict,
+                      materialTypes: np.ndarray, slope: (int, int) = (0, 0)) -> bool:
+        # python ints, so the heights along a steep slope can't overflow the dtype of the grid
+        height, slopeX, slopeY = int(height), int(slope[0]), int(slope[1])
+        return self.footprintTest(coordinates, worldSize, runs["road"], lambda X, Y, deltaX, deltaY:
+                                  height + slopeX * deltaX + slopeY * deltaY == displacementGrid[X][Y] and
+                                  not finishedGrid[X, Y] and materialIndex == materialGrid[X, Y])
 
     def brickFlatTest(self, coordinates: (int, int), worldSize: (int, int), height: int, materialIndex: int,
-                      displacementGrid: np.ndarray, materialGrid: [[int]], finishedGrid: [[bool]], testedGrid: [[bool]])\
-            -> bool:
-        def test(first: int, second: int):
-            for deltaX in range(self.size[first]):
-                for deltaY in range(self.size[second]):
-                    if not testedGrid[deltaX,deltaY]:
-                        X = coordinates[0] + deltaX
-                        if X >= worldSize[0]:
-                            return False
-                        Y = coordinates[1] + deltaY
-                        if Y >= worldSize[1]:
-                            return False
-                        if height != displacementGrid[X, Y] or finishedGrid[X, Y] or materialIndex != materialGrid[X][Y]:
-                            return False
-                        else:
-                            testedGrid[deltaX, deltaY] = True
-            return True
-        if test(0,1):
-            return True
-        return False
+                      displacementGrid: np.ndarray, materialGrid: [[int]], finishedGrid: [[bool]], runs: dict,
+                      materialTypes: np.ndarray, slope: (int, int) = (0, 0)) -> bool:
+        return self.footprintTest(coordinates, worldSize, runs["flat"], lambda X, Y, deltaX, deltaY:
+                                  height == displacementGrid[X, Y] and not finishedGrid[X, Y] and
+                                  materialIndex == materialGrid[X, Y])
 
-    def treeTest(self, coordinates: (int, int), worldSize: (int, int), displacementGrid: [[int]]) -> bool:
+    def footprintTest(self, coordinates: (int, int), worldSize: (int, int), runs: ([int], [bool]), cellTest) -> bool:
+        """
+        Tests if the brick can cover all cells under it. For every row under the coordinates runs stores how many
+        cells from the coordinates on passed the test and if the row ends there, so the other bricks tested at the
+        same coordinates continue the scan of a row instead of testing its cells again.
+
+        :param runs: (lengths, ended) scratch lists of the material, reset for every coordinates
+        :param cellTest: function(X, Y, deltaX, deltaY) that returns True if the brick can cover the cell
+        :return: True if the brick can be placed, False if not
+        """
+        lengths, ended = runs
         for deltaX in range(self.size[0]):
-            for deltaY in range(self.size[1]):
-                X = coordinates[0] + deltaX
-                if X >= worldSize[0]:
-                    return False
-                Y = coordinates[1] + deltaY
-                if Y >= worldSize[1]:
-                    return False
-                if displacementGrid[coordinates[0]][coordinates[1]] != displacementGrid[X][Y]:
+            length = lengths[deltaX]
+            if length >= self.size[1]:
+                continue
+            if ended[deltaX]:
+                return False
+            X = coordinates[0] + deltaX
+            while length < self.size[1]:
+                Y = coordinates[1] + length
+                if X >= worldSize[0] or Y >= worldSize[1] or not cellTest(X, Y, deltaX, length):
+                    lengths[deltaX], ended[deltaX] = length, True
                     return False
+                length += 1
+            lengths[deltaX] = length
         return True
 
+    def treeTest(self, coordinates: (int, int), worldSize: (int, int), height: int, materialIndex: int,
+                 displacementGrid: np.ndarray, materialGrid: [[int]], finishedGrid: [[bool]], runs: dict,
+                 materialTypes: np.ndarray, slope: (int, int) = (0, 0)) -> bool:
+        # a tree brick of a material needs a flat and free footprint like a flat brick, the trees of the tree types are
+        # tested all at once, see trees.footprintMasks
+        return self.brickFlatTest(coordinates, worldSize, height, materialIndex, displacementGrid, materialGrid,
+                                  finishedGrid, runs, materialTypes, slope)
+
     def redefineBrick(self, displacementGrid: np.array, coordinates: [int, int, int], worldscale: [float, float, float],
-                      worldOffset: [float, float, float], worldSize: [int, int]):
+                      worldOffset: [float, float, float], worldSize: [int, int], footprint: (int, int) = None,
+                      slope: (int, int) = (0, 0), zRotation: int = None):
+        """
+        :param footprint: size of the placed brick on the grid, swapped if it is turned by 90 degrees (see
+         material.orientations). The mesh is turned around its origin, so it is moved by the turned offset
+         (size y - offset y, offset x) to cover the turned footprint again
+        :param slope: slope of the road in x and y direction at the coordinates, road bricks are scaled and tilted to it
+        :param zRotation: rotation around z in degrees. Default: the one the slope test chose (self.rotation)
+        """
+        turned = footprint is not None and (footprint[0], footprint[1]) != (self.size[0], self.size[1])
+        footprint = footprint or self.size
 
         def testHeight(local: [int, int], axis: int):
             if 0 <= local[not axis] < worldSize[not axis]:
-                for local[axis] in range(coordinates[axis], coordinates[axis] + self.size[axis]):
+                for local[axis] in range(coordinates[axis], coordinates[axis] + footprint[axis]):
                     if 0 <= local[axis] < worldSize[axis]:
                         if displacementGrid[local[0], local[1]] < coordinates[2]:
                             return True
@@ -308,13 +277,13 @@ class normalBrick(brick):
                 if testHeight([coordinates[0], coordinates[1] - 1], 0):
                     self.placedEdgeBricks += 1
                     return self.linkedObject
-                if testHeight([coordinates[0], coordinates[1] + self.size[1]], 0):
+                if testHeight([coordinates[0], coordinates[1] + footprint[1]], 0):
                     self.placedEdgeBricks += 1
                     return self.linkedObject
                 if testHeight([coordinates[0] - 1, coordinates[1]], 1):
                     self.placedEdgeBricks += 1
                     return self.linkedObject
-                if testHeight([coordinates[0] + self.size[0], coordinates[1]], 1):
+                if testHeight([coordinates[0] + footprint[0], coordinates[1]], 1):
                     self.placedEdgeBricks += 1
                     return self.linkedObject
                 self.placedFlatBricks += 1
@@ -323,43 +292,37 @@ class normalBrick(brick):
             return self.linkedObject
 
         linkedModels = defineModel()
-        linkedModel = linkedModels[randrange(len(linkedModels))]
-
-        rotation = [0, 0, math.radians(randrange(360) if self.randomZRotation else self.rotation)]
+        shape, angle = 0, 0
+        if len(linkedModels) > 1 or self.randomZRotation:
+            shape, angle = sharedRandom.draw(self.stream, sharedPlacements.worldCoordinates(coordinates),
+                                             (len(linkedModels), 360))
+        linkedModel = linkedModels[shape]
+
+        rotation = [0, 0, math.radians(angle if self.randomZRotation else
+                                       (self.rotation if zRotation is None else zRotation))]
         scale = [1,1,1]
 
         # "apply" Rotation and Scaling for road bricks
         if self.objectType == self.brickRoadTest:
-            if self.slopeX:
-                scale[0] = math.sqrt((self.size[0] * worldscale[0]) ** 2 + (self.slopeX * worldscale[2] * self.size[0]) ** 2) / (self.size[0] * worldscale[0])
-                rotation[1] = math.atan(self.slopeX * worldscale[2] / worldscale[0])
-            if self.slopeY:
-                scale[1] = math.sqrt((self.size[1] * worldscale[1]) ** 2 + (self.slopeY * worldscale[2] * self.size[1]) ** 2) / (self.size[1] * worldscale[1])
-                rotation[0] = -math.atan(self.slopeY * worldscale[2] / worldscale[1])
+            if slope[0]:
+                scale[0], rotation[1] = sharedRoadSlopes.get(slope[0], self.size[0], worldscale[0], worldscale[2])
+            if slope[1]:
+                scale[1], angle = sharedRoadSlopes.get(slope[1], self.size[1], worldscale[1], worldscale[2])
+                rotation[0] = -angle
+
+        sharedPlacements.add(self, coordinates, rotation,
+                             shape if linkedModels is self.linkedObject else len(self.linkedObject) + shape,
+                             [self.scale[0] * scale[0], self.scale[1] * scale[1], self.scale[2] * scale[2]])
 
         # add WorldOffset
         coordinates = [coordinates[0] + worldOffset[0],
                        coordinates[1] + worldOffset[1],
                        coordinates[2] + worldOffset[2]]
 
-        self.placeInstance(coordinates, worldscale, rotation, linkedModel, scale)
+        self.placeInstance(coordinates, worldscale, rotation, linkedModel, scale,
+                           (self.size[1] - self.offset[1], self.offset[0], self.offset[2]) if turned else None)
 
 
 class wallBrick(brick):
     def __init__(self, data: dict):
         brick.__init__(self, data)
-
-    def brickTest(self, coordinate: int, material, bottomLimitRow: np.ndarray, materialRow: [[]]) -> bool:
-        MAX_SIZE: int = len(bottomLimitRow)
-        HEIGHT: int = bottomLimitRow[coordinate]
-        MATERIAL = materialRow[coordinate]
-        for localX in range(coordinate, coordinate + self.size[0]):
-            if localX >= MAX_SIZE:
-                return False
-            if bottomLimitRow[localX] != HEIGHT or materialRow[localX] != MATERIAL:
-                return False
-        return True
-
-    def redefineBrick(self, coordinates, worldscale, smallRotation, bickRotation):
-        rotation = [0, 0, math.radians(90 * smallRotation + 180 * bickRotation)]
-        self.placeInstance(coordinates, worldscale, rotation, self.linkedObject[randrange(len(self.linkedObject))])
@@ -0,0 +1,208 @@
+import os
+import pickle
+from hashlib import sha1
+from json import loads
+from instrumentation import sharedProfiler
+
+# bump when the compiled format changes, older cache files are ignored
+CACHE_VERSION = 4
+# fields every material and every brick of a material needs, all others have defaults
+MATERIAL_FIELDS = ("color", "bricks")
+BRICK_FIELDS = ("name", "size", "persistentID", "linkedObject")
+# types of a material and of its bricks, tree bricks are tested like trees (see bricks.normalBrick.treeTest)
+MATERIAL_TYPES = ("flat", "slope", "road")
+BRICK_TYPES = MATERIAL_TYPES + ("tree",)
+# defaults of the optional fields of a brick (see bricks.brick), rotateOffset and priority depend on the brick
+BRICK_DEFAULTS = {"offset": (0, 0, 0), "scale": [1, 1, 1], "randomZRotation": False}
+NORMAL_BRICK_DEFAULTS = {"rotatable": False, "linkedFlatObject": [False], "type": "flat", "minSlope": 0, "cost": 1}
+
+
+def isNumber(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def isVector(value, length: int) -> bool:
+    return isinstance(value, (list, tuple)) and len(value) == length and all(isNumber(v) for v in value)
+
+
+def brickProblems(brick: dict, label: str, wall: bool) -> [str]:
+    """
+    :param brick: brick of a material config with all defaults set
+    :param label: position of the brick in the config, used in the messages
+    :param wall: True for wall bricks, they only need x and z
+    :return: one message for every field with a wrong type or size
+    """
+    problems = []
+    size = brick["size"]
+    used = (0, 2) if wall else (0, 1)
+    if not (isinstance(size, list) and len(size) == 3 and all(isinstance(v, int) and not isinstance(v, bool)
+                                                              and v >= 0 for v in size)
+            and all(size[i] > 0 for i in used)):
+        problems.append(f'{label}.size: {size!r} is not 3 whole numbers for x, y and z with '
+                        f'{"x and z" if wall else "x and y"} at least 1')
+    for field in ("name", "persistentID"):
+        if not isinstance(brick[field], str):
+            problems.append(f'{label}.{field}: {brick[field]!r} is not a string')
+    objects = brick["linkedObject"]
+    if not (isinstance(objects, list) and objects and all(isinstance(o, str) for o in objects)):
+        problems.append(f'{label}.linkedObject: {objects!r} is not a list of paths')
+    for field in ("offset", "scale"):
+        if not isVector(brick[field], 3):
+            problems.append(f'{label}.{field}: {brick[field]!r} is not 3 numbers')
+    flags = ["randomZRotation", "rotateOffset"] + ([] if wall else ["rotatable"])
+    problems += [f'{label}.{field}: {brick[field]!r} is not true or false' for field in flags
+                 if not isinstance(brick[field], bool)]
+    if wall:
+        return problems
+    if not isinstance(brick["linkedFlatObject"], list):
+        problems.append(f'{label}.linkedFlatObject: {brick["linkedFlatObject"]!r} is not a list')
+    if brick["type"] not in BRICK_TYPES:
+        problems.append(f'{label}.type: {brick["type"]!r} is not one of {", ".join(BRICK_TYPES)}')
+    for field in ("minSlope", "priority", "cost"):
+        if not isNumber(brick[field]):
+            problems.append(f'{label}.{field}: {brick[field]!r} is not a number')
+    return problems
+
+
+def compileConfig(data: dict, path: str) -> (dict, [str]):
+    """
+    Validates a material config and compiles it into the tables of its bricks, every brick with all defaults set, so
+    the bricks can be built from them without any further check (see materials.material).
+
+    :param data: parsed material config
+    :param path: path of the config, used in the messages
+    :return: compiled config with the "name", "color", "type", "bricks" and "wallBricks" of the material, and one
+     message for every missing field or field with a wrong type or size. The compiled config is None if there is any.
+    """
+    if not isinstance(data, dict):
+        return None, [f'{path}: is not a material but a {type(data).__name__}']
+    problems = [f'{path}: {field}' for field in MATERIAL_FIELDS if field not in data]
+    color = data.get("color", [0, 0, 0])
+    if not (isinstance(color, list) and len(color) in (3, 4) and
+            all(isinstance(c, int) and not isinstance(c, bool) and 0 <= c <= 255 for c in color)):
+        problems.append(f'{path}: color: {color!r} is not 3 (RGB) or 4 (RGBA) numbers from 0 to 255')
+    if data.get("type", "flat") not in MATERIAL_TYPES:
+        problems.append(f'{path}: type: {data["type"]!r} is not one of {", ".join(MATERIAL_TYPES)}')
+    if "bricks" in data and not data["bricks"]:
+        problems.append(f'{path}: bricks: no bricks in material, you need at least a 1x1 brick')
+    tables = {}
+    for key, wall in (("bricks", False), ("wallBricks", True)):
+        entries = data.get(key, [])
+        if not isinstance(entries, list) or not all(isinstance(brick, dict) for brick in entries):
+            problems.append(f'{path}: {key}: is not a list of bricks')
+            continue
+        tables[key] = []
+        for i, brick in enumerate(entries):
+            label = f'{path}: {key}[{brick.get("name", i)}]'
+            missing = [f'{label}.{field}' for field in BRICK_FIELDS if field not in brick]
+            problems += missing
+            if missing:
+                continue
+            table = dict(BRICK_DEFAULTS, **({} if wall else NORMAL_BRICK_DEFAULTS))
+            table.update(brick)
+            size = table["size"]
+            if "rotateOffset" not in brick:
+                table["rotateOffset"] = isinstance(size, list) and len(size) > 1 and size[0] != size[1]
+            if not wall and table.get("priority") is None:
+                # by default the priority is the position in the list, see materials.material
+                table["priority"] = i
+            problems += brickProblems(table, label, wall)
+            tables[key].append(table)
+    if problems:
+        return None, problems
+    return {"name": data.get("name"), "color": color, "type": data.get("type", "flat"), "bricks": tables["bricks"],
+            "wallBricks": tables["wallBricks"]}, []
+
+
+class configCache:
+    def __init__(self):
+        """
+        Compiled material configs: every config is parsed, validated and compiled into the tables of its bricks once
+        (see compileConfig) and stored together with the
+        modification time, size and sha1 hash of its file. A config is only read again if the time or size changed and
+        only parsed again if the hash changed too. If path is set, the compiled configs are kept in this file between
+        runs.
+        """
+        self.path = None
+        self.entries = {}
+        self.changed = False
+
+    def clear(self):
+        self.__init__()
+
+    def open(self, path: str):
+        """
+        Loads the compiled configs of an earlier run.
+
+        :param path: path of the cache file, created by save if it doesn't exist
+        """
+        self.path = path
+        if not os.path.isfile(path):
+            return
+        with open(path, "rb") as file:
+            stored = pickle.load(file)
+        if stored.get("version") == CACHE_VERSION:
+            self.entries.update(stored["entries"])
+
+    def save(self):
+        if self.path is None or not self.changed:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, "wb") as file:
+            pickle.dump({"version": CACHE_VERSION, "entries": self.entries}, file)
+        self.changed = False
+
+    def entry(self, path: str) -> dict:
+        """
+        :return: the up to date entry of the config with its "hash" and either its "compiled" tables or its "problems"
+        """
+        key = os.path.abspath(path)
+        status = os.stat(key)
+        stamp = (status.st_mtime_ns, status.st_size)
+        entry = self.entries.get(key)
+        if entry is not None and entry["stamp"] == stamp:
+            sharedProfiler.count("configCacheHits")
+            return entry
+        with open(key, "rb") as file:
+            content = file.read()
+        digest = sha1(content).hexdigest()
+        if entry is None or entry["hash"] != digest:
+            sharedProfiler.count("configCacheMisses")
+            compiled, problems = compileConfig(loads(content), path)
+            entry = {"hash": digest, "compiled": compiled, "problems": problems}
+        self.entries[key] = dict(entry, stamp=stamp)
+        self.changed = True
+        return self.entries[key]
+
+    def hash(self, path: str) -> str:
+        """
+        :return: sha1 hash of the content of the config
+        """
+        return self.entry(path)["hash"]
+
+    def load(self, path: str) -> dict:
+        """
+        :return: the compiled config, see compileConfig. Don't change it
+        :raises ValueError: with all missing and wrong fields of the config
+        """
+        entry = self.entry(path)
+        if entry["problems"]:
+            raise ValueError("wrong material config:\n" + "\n".join(entry["problems"]))
+        return entry["compiled"]
+
+    def validate(self, paths: [str]):
+        """
+        Checks all configs at once, so every missing field and every field with a wrong type or size of every config
+        is reported in one error.
+
+        :raises ValueError: with all missing and wrong fields of all configs
+        """
+        problems = [problem for path in paths for problem in self.entry(path)["problems"]]
+        if problems:
+            raise ValueError("wrong material configs:\n" + "\n".join(problems))
+
+
+# shared by all materials
+sharedConfigs = configCache()
@@ -0,0 +1,141 @@
+import numpy as np
+from preprocessing import heightType
+
+# brick types whose fit test only depends on the footprint being uniform and can therefore be precomputed
+PRECOMPUTABLE_TYPES = ("flat", "road")
+
+
+def runLengths(keyGrid: np.ndarray, axis: int) -> np.ndarray:
+    """
+    Counts for every cell how many consecutive cells (including itself) have the same key in positive direction of
+    the given axis.
+
+    :param keyGrid: 2D array of comparable keys
+    :param axis: 0 for the x-direction, 1 for the y-direction
+    :return: int32 array with the same shape as keyGrid
+    """
+    grid = np.moveaxis(keyGrid, axis, -1)
+    length = grid.shape[-1]
+    index = np.arange(length, dtype=np.int32)
+    isEnd = np.ones(grid.shape, bool)
+    isEnd[..., :-1] = grid[..., :-1] != grid[..., 1:]
+    endIndex = np.where(isEnd, index, length).astype(np.int32)
+    endIndex = np.minimum.accumulate(endIndex[..., ::-1], axis=-1)[..., ::-1]
+    return np.moveaxis(endIndex - index + 1, -1, axis)
+
+
+def uniformMask(keyGrid: np.ndarray, size: (int, int)) -> np.ndarray:
+    """
+    Returns a mask of all cells at which a block of the given size can be anchored, so that the whole block lies
+    inside the grid and every cell of it has the same key as the anchor.
+
+    :param keyGrid: 2D array of comparable keys
+    :param size: size of the block in x and y direction
+    :return: boolean array with the same shape as keyGrid
+    """
+    mask = runLengths(keyGrid, 1) >= size[1]
+    for _ in range(1, size[0]):
+        mask[:-1] &= mask[1:]
+        mask[-1] = False
+    mask &= runLengths(keyGrid, 0) >= size[0]
+    return mask
+
+
+def roadSlopes(displacementGrid: np.ndarray, roadMask: np.ndarray) -> (np.ndarray, np.ndarray):
+    """
+    Computes the slope in x and y direction for every cell at once: the forward difference if the next cell is a road,
+    otherwise the backward difference if the previous one is a road, otherwise 0.
+
+    :param displacementGrid: Grid that stores the height of the terrain
+    :param roadMask: boolean grid that is True on every cell with a road material
+    :return: slopeX and slopeY as int64 arrays
+    """
+    height = displacementGrid.astype(np.int64)
+    slopes = []
+    for axis in (0, 1):
+        forward = np.zeros(height.shape, np.int64)
+        forwardValid = np.zeros(height.shape, bool)
+        backward = np.zeros(height.shape, np.int64)
+        backwardValid = np.zeros(height.shape, bool)
+        difference = np.diff(height, axis=axis)
+        if axis == 0:
+            forward[:-1], forwardValid[:-1] = difference, roadMask[1:]
+            backward[1:], backwardValid[1:] = difference, roadMask[:-1]
+        else:
+            forward[:, :-1], forwardValid[:, :-1] = difference, roadMask[:, 1:]
+            backward[:, 1:], backwardValid[:, 1:] = difference, roadMask[:, :-1]
+        slopes.append(np.where(forwardValid, forward, np.where(backwardValid, backward, 0)))
+    return slopes[0], slopes[1]
+
+
+class fitTable:
+    def __init__(self, displacementGrid: np.ndarray, indexGrid: np.ndarray, materials: list):
+        """
+        Precomputes for every cell which bricks of its material would fit there if no brick was placed yet. The
+        result is stored as one bit per brick in fitBits, so the placer only has to check the occupied cells.
+
+        :param displacementGrid: Grid that stores the height of the terrain
+        :param indexGrid: Grid that stores the index of the material of every cell
+        :param materials: list of all materials
+        """
+        self.materials = materials
+        numBricks = max([len(mat.brickTable) for mat in materials] + [1])
+        dtype = next((t for t in (np.uint8, np.uint16, np.uint32, np.uint64) if np.iinfo(t).bits >= numBricks),
+                     np.uint64)
+        # materials with more bricks than bits or with not precomputable brick types are tested per cell
+        self.supported = [len(mat.brickTable) <= np.iinfo(dtype).bits and
+                          len({brick["type"] for brick in mat.brickTable}) == 1 and
+                          mat.brickTable[0]["type"] in PRECOMPUTABLE_TYPES for mat in materials]
+        self.fitBits = np.zeros(indexGrid.shape, dtype)
+
+        height = displacementGrid.astype(np.int64)
+        index = indexGrid.astype(np.int64)
+        flatKey = height * len(materials) + index
+        roadMask = np.isin(indexGrid, [i for i, mat in enumerate(materials) if mat.materialType == "road"])
+        # the slopes are computed once for the whole map, also for the road bricks that are tested per cell. They are
+        # kept in the smallest type that holds the difference of two heights instead of two int64 grids
+        self.slopeX, self.slopeY = None, None
+        if any(brick["type"] == "road" for i, mat in enumerate(materials) for brick in mat.brickTable
+               if np.any(indexGrid == i)):
+            slopeType = heightType(int(height.min()), int(height.max()))
+            self.slopeX, self.slopeY = (slope.astype(slopeType) for slope in roadSlopes(height, roadMask))
+
+        for i, mat in enumerate(materials):
+            if not self.supported[i] or not np.any(indexGrid == i):
+                continue
+            if mat.brickTable[0]["type"] == "flat":
+                self.addBits(flatKey, indexGrid == i, mat)
+            else:
+                self.addRoadBits(height, index, indexGrid == i, mat)
+
+    def addBits(self, keyGrid: np.ndarray, anchorMask: np.ndarray, mat, window=(slice(None), slice(None))):
+        for bit, brick in enumerate(mat.bricks):
+            fits = uniformMask(keyGrid, brick.size[:2]) & anchorMask
+            self.fitBits[window][fits] |= self.fitBits.dtype.type(1 << bit)
+
+    def addRoadBits(self, height: np.ndarray, index: np.ndarray, materialMask: np.ndarray, mat):
+        # a road brick fits if the terrain follows the plane given by the slope at the anchor. Every cell of the
+        # footprint is compared with the anchor for all anchors at once, only the anchors that still fit are kept, so
+        # the cost grows with the number of anchors, not with the number of distinct slopes
+        rows, columns = np.nonzero(materialMask)
+        slopeX, slopeY = self.slopeX[rows, columns].astype(np.int64), self.slopeY[rows, columns].astype(np.int64)
+        anchorHeight, anchorIndex = height[rows, columns], index[rows, columns]
+        for bit, brick in enumerate(mat.bricks):
+            sizeX, sizeY = brick.size[:2]
+            fits = np.flatnonzero((rows + sizeX <= height.shape[0]) & (columns + sizeY <= height.shape[1]))
+            for i in range(sizeX):
+                for j in range(sizeY):
+                    if i or j:
+                        x, y = rows[fits] + i, columns[fits] + j
+                        fits = fits[(height[x, y] - slopeX[fits] * i - slopeY[fits] * j == anchorHeight[fits]) &
+                                    (index[x, y] == anchorIndex[fits])]
+            self.fitBits[rows[fits], columns[fits]] |= self.fitBits.dtype.type(1 << bit)
+
+    def slope(self, coordinates: (int, int)) -> (int, int):
+        """
+        :param coordinates: coordinates of a road cell
+        :return: slope in x and y direction at the coordinates, see roadSlopes. 0 if the map has no road bricks
+        """
+        if self.slopeX is None:
+            return 0, 0
+        return int(self.slopeX[coordinates]), int(self.slopeY[coordinates])
@@ -0,0 +1,74 @@
+import numpy as np
+from preprocessing import heightType
+from instrumentation import sharedProfiler
+
+
+class gridState:
+    def __init__(self, displacementGrid: np.ndarray, area: (int, int, int, int) = None, headroom: int = 0):
+        """
+        State of the cells while the bricks are placed, shared by the pass of the normal bricks and the walls:
+
+        * heights: height of the terrain with the normal bricks placed on top (brickHeightGrid). It has the type of the
+          displacementGrid unless the highest height plus the headroom doesn't fit, then a wider one, see
+          preprocessing.heightType
+        * finished: boolean grid of the cells covered by a normal brick. It is only needed while the normal bricks
+          are placed, afterwards it is kept as a bitset of 8 cells per byte in finishedBits, see packFinished
+
+        :param displacementGrid: Grid that stores the height of the terrain
+        :param area: (startX, endX, startY, endY) of the cells at which bricks are anchored, all other cells start as
+         finished. Default: all cells
+        :param headroom: height a normal brick adds at most, see preprocessing.brickHeadroom
+        :raises OverflowError: if the heights with the headroom don't fit into a 64 bit integer
+        """
+        displacementGrid = np.asarray(displacementGrid)
+        size = displacementGrid.shape
+        area = area or (0, size[0], 0, size[1])
+        dtype = displacementGrid.dtype
+        if np.issubdtype(dtype, np.integer) and displacementGrid.size:
+            low, high = int(displacementGrid.min()), int(displacementGrid.max())
+            if high + headroom > np.iinfo(dtype).max:
+                dtype = np.promote_types(dtype, heightType(low, high, headroom))
+        self.size = size
+        self.heights = displacementGrid.astype(dtype)
+        self.finished = np.ones(size, bool)
+        self.finished[area[0]:area[1], area[2]:area[3]] = False
+        self.finishedBits = None
+
+    def packFinished(self):
+        """
+        Replaces the boolean finished grid with a bitset once no normal brick is placed anymore.
+        """
+        if self.finished is not None:
+            self.finishedBits = np.packbits(self.finished, axis=1)
+            self.finished = None
+
+    def carry(self, start: int) -> (np.ndarray, np.ndarray):
+        """
+        :param start: first row that is carried
+        :return: copies of the occupancy as bitset and the heights of the rows from start on, for the next part of the
+         world (e.g. the rows bricks of a band reach into), see loadRows
+        """
+        self.packFinished()
+        return self.finishedBits[start:].copy(), self.heights[start:].copy()
+
+    def loadRows(self, carried: (np.ndarray, np.ndarray)):
+        """
+        Takes over the carried state of the previous part of the world as the first rows, see carry.
+        """
+        finishedBits, heights = carried
+        self.finished[:len(finishedBits)] = np.unpackbits(finishedBits, axis=1, count=self.size[1]).astype(bool)
+        self.heights[:len(heights)] = heights
+
+    def footprint(self) -> dict:
+        """
+        :return: bytes used by the heights and the occupancy
+        """
+        finished = self.finished if self.finished is not None else self.finishedBits
+        return {"heights": self.heights.nbytes, "finished": finished.nbytes}
+
+    def report(self):
+        """
+        Adds the footprint to the profiler, as the largest one of all parts of the world.
+        """
+        for name, amount in self.footprint().items():
+            sharedProfiler.peak(f'{name}GridBytes', amount)
@@ -0,0 +1,149 @@
+import cProfile
+import pstats
+import tracemalloc
+from contextlib import contextmanager
+from json import dump
+from time import time
+
+# minimum number of seconds between two progress lines
+PROGRESS_INTERVAL = 5
+# number of functions listed in the report of the cpu profiler
+PROFILE_ENTRIES = 30
+
+
+class profiler:
+    def __init__(self):
+        """
+        Collects the time of the stages of the generation (load, convert, quantize, place, walls, trees, lod, write)
+        and named counters. Nothing is printed unless verbose is set, then log messages and a progress line with the
+        estimated remaining time of the running stage are printed.
+        """
+        self.verbose = False
+        self.progressInterval = PROGRESS_INTERVAL
+        self.stages = {}
+        self.counters = {}
+        # counters that keep their largest amount, see peak
+        self.peaks = set()
+        self.stageStarts = {}
+        self.lastProgress = 0
+        self.cpuProfile = None
+        self.memoryProfile = False
+
+    def clear(self):
+        """
+        Forgets all stages and counters, the settings are kept.
+        """
+        self.stages, self.counters, self.peaks, self.stageStarts, self.lastProgress = {}, {}, set(), {}, 0
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Adds the time spent inside the with block to the stage.
+
+        :param name: name of the stage
+        """
+        startTimer = time()
+        # stages that run in parts (bands, tiles) report their progress since the first part
+        self.stageStarts.setdefault(name, startTimer)
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0) + time() - startTimer
+            self.log(f'{name}: {round(time() - startTimer, 4)} sec.')
+
+    def count(self, name: str, amount: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def peak(self, name: str, amount: int):
+        """
+        Keeps the largest amount of the counter instead of the sum.
+        """
+        self.peaks.add(name)
+        self.counters[name] = max(self.counters.get(name, 0), amount)
+
+    def merge(self, counters: dict, peaks: [str] = ()):
+        """
+        Adds the counters of another process, the peak counters keep the largest amount.
+
+        :param peaks: names of the peak counters, see peak
+        """
+        for name, amount in counters.items():
+            if name in peaks:
+                self.peak(name, amount)
+            else:
+                self.count(name, amount)
+
+    def log(self, message: str):
+        if self.verbose:
+            print(message)
+
+    def progress(self, name: str, done: int, total: int):
+        """
+        Prints the progress of the stage at most every progressInterval seconds if verbose.
+
+        :param name: name of the running stage
+        :param done: number of finished units (rows, bands, ...)
+        :param total: number of all units
+        """
+        if not self.verbose:
+            return
+        now = time()
+        if now - self.lastProgress < self.progressInterval and done < total:
+            return
+        self.lastProgress = now
+        elapsed = now - self.stageStarts.get(name, now)
+        remaining = elapsed / done * (total - done) if done else 0
+        print(f'{name}: {done}/{total} ({round(100 * done / total, 1)}%), {round(elapsed, 1)} sec., '
+              f'ETA {round(remaining, 1)} sec.')
+
+    def enable(self, cpu: bool = False, memory: bool = False):
+        """
+        Starts the optional profilers.
+
+        :param cpu: profile all function calls with cProfile
+        :param memory: trace the memory allocations with tracemalloc
+        """
+        if cpu and self.cpuProfile is None:
+            self.cpuProfile = cProfile.Profile()
+            self.cpuProfile.enable()
+        if memory and not self.memoryProfile:
+            self.memoryProfile = True
+            tracemalloc.start()
+
+    def report(self, materials: list = ()) -> dict:
+        """
+        :param materials: materials whose statistics are added to the report
+        :return: dictionary with the stage times, counters, the placed bricks of all materials, the rotation cache, the
+         placement store and the results of the optional profilers
+        """
+        from rotations import sharedRotations
+        from placements import sharedPlacements
+
+        report = {"stages": dict(self.stages), "counters": dict(self.counters),
+                  "materials": [mat.statistics() for mat in materials]}
+        report.update(sharedRotations.statistics())
+        report.update(sharedPlacements.statistics())
+        if self.cpuProfile is not None:
+            self.cpuProfile.disable()
+            stats = pstats.Stats(self.cpuProfile)
+            entries = sorted(stats.stats.items(), key=lambda entry: entry[1][3], reverse=True)[:PROFILE_ENTRIES]
+            report["cpuProfile"] = [{"function": f'{path}:{line}({function})', "calls": calls,
+                                     "totalTime": totalTime, "cumulativeTime": cumulativeTime}
+                                    for (path, line, function), (_, calls, totalTime, cumulativeTime, _)
+                                    in entries]
+            self.cpuProfile.enable()
+        if self.memoryProfile:
+            current, peak = tracemalloc.get_traced_memory()
+            report["memory"] = {"current": current, "peak": peak}
+        return report
+
+    def save(self, path: str, materials: list = ()):
+        """
+        Writes the report as json.
+        """
+        with open(path, "w") as file:
+            dump(self.report(materials), file, indent=2)
+
+
+# shared by all modules
+sharedProfiler = profiler()
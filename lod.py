@@ -0,0 +1,146 @@
+import numpy as np
+from output import instanceSink
+from instrumentation import sharedProfiler
+
+# name of the output folder and the __parent of the boxes of the far cells
+LOD_NAME = "lod"
+
+
+def uniformRectangles(grid: np.ndarray) -> [(int, int, int, int, int)]:
+    """
+    Splits a grid into rectangles of the same value: every row is split into runs, runs with the same start, end and
+    value in consecutive rows are merged.
+
+    :param grid: 2D array of integers
+    :return: (startX, endX, startY, endY, value) of every rectangle
+    """
+    rectangles = []
+    # runs of the previous row with the row they started in
+    active = {}
+    for x in range(grid.shape[0]):
+        row = grid[x]
+        starts = np.flatnonzero(np.concatenate(([True], row[1:] != row[:-1])))
+        ends = np.append(starts[1:], len(row))
+        runs = {(start, end, value) for start, end, value in zip(starts.tolist(), ends.tolist(), row[starts].tolist())}
+        for run in list(active):
+            if run not in runs:
+                rectangles.append((active.pop(run), x, run[0], run[1], run[2]))
+        for run in runs:
+            active.setdefault(run, x)
+    rectangles += [(startX, grid.shape[0], run[0], run[1], run[2]) for run, startX in active.items()]
+    return sorted(rectangles)
+
+
+class lodGrid:
+    def __init__(self):
+        """
+        Level of detail: the world is split into square cells. Cells near a focus area keep all their brick instances.
+        The instances of the other (far) cells are not written, instead every far cell is covered by a few scaled boxes
+        in its own output folder, see writeFarCells.
+        """
+        self.enabled = False
+        self.cellSize = 64
+        self.focusAreas = []
+        self.boxObject = None
+        self.worldSize = (0, 0)
+        self.worldOffset = (0, 0, 0)
+        self.far = np.zeros((0, 0), bool)
+        # far as nested lists, for the lookups of single instances, see isFar
+        self.farRows = []
+
+    def configure(self, cellSize: int, focusAreas: [[float, float, float]], boxObject: str, worldSize: (int, int),
+                  worldOffset: [float, float, float]):
+        """
+        :param cellSize: edge length of a cell in bricks
+        :param focusAreas: x, y and radius in bricks of every focus area. A cell is near if any of its cells is inside
+         a focus area
+        :param boxObject: DAE-file of a box from 0 to 1 in x, y and z that is scaled to the far terrain
+        :param worldSize: size of the world in bricks
+        :param worldOffset: offset of the world, see config.json
+        """
+        self.enabled = True
+        self.cellSize, self.focusAreas, self.boxObject = cellSize, focusAreas, boxObject
+        self.worldSize, self.worldOffset = tuple(worldSize), tuple(worldOffset)
+        startX = np.arange(0, worldSize[0], cellSize)[:, None]
+        startY = np.arange(0, worldSize[1], cellSize)[None, :]
+        self.far = np.ones((startX.shape[0], startY.shape[1]), bool)
+        for x, y, radius in focusAreas:
+            # distance from the focus point to the nearest cell of every lod cell
+            distanceX = np.maximum(np.maximum(startX - x, x - (np.minimum(startX + cellSize, worldSize[0]) - 1)), 0)
+            distanceY = np.maximum(np.maximum(startY - y, y - (np.minimum(startY + cellSize, worldSize[1]) - 1)), 0)
+            self.far &= distanceX ** 2 + distanceY ** 2 > radius ** 2
+        self.farRows = self.far.tolist()
+
+    def settings(self) -> dict:
+        """
+        :return: the arguments of configure, to configure the lodGrid of a worker process the same way
+        """
+        return {"cellSize": self.cellSize, "focusAreas": self.focusAreas, "boxObject": self.boxObject,
+                "worldSize": self.worldSize, "worldOffset": self.worldOffset}
+
+    def farMask(self, coordinates: [[float, float, float]]) -> np.ndarray:
+        """
+        :param coordinates: coordinates of instances with the world offset added, like placeInstance gets them
+        :return: boolean array, True for every instance in a far cell
+        """
+        coordinates = np.asarray(coordinates, np.float64).reshape(-1, 3)
+        x = np.rint(coordinates[:, 0] - self.worldOffset[0]).astype(np.int64) // self.cellSize
+        y = np.rint(coordinates[:, 1] - self.worldOffset[1]).astype(np.int64) // self.cellSize
+        inside = (x >= 0) & (y >= 0) & (x < self.far.shape[0]) & (y < self.far.shape[1])
+        far = np.zeros(len(coordinates), bool)
+        far[inside] = self.far[x[inside], y[inside]]
+        return far
+
+    def isFar(self, coordinates: [float, float, float]) -> bool:
+        """
+        Same as farMask for a single instance, without creating any array.
+
+        :param coordinates: coordinates of the instance with the world offset added
+        :return: True if the instance is in a far cell
+        """
+        # round like np.rint, half to even
+        x = int(round(float(coordinates[0]) - self.worldOffset[0])) // self.cellSize
+        y = int(round(float(coordinates[1]) - self.worldOffset[1])) // self.cellSize
+        return 0 <= x < len(self.farRows) and 0 <= y < len(self.farRows[x]) and self.farRows[x][y]
+
+    def writeFarCells(self, store, zStepSize: int, worldScale: [float, float, float]) -> int:
+        """
+        Covers every far cell with boxes: the tops of the normal bricks in the cell (see placementStore.topHeights)
+        are split into rectangles of the same height and every rectangle gets one box from height 0 up to its top. A
+        top at or below 0 (e.g. below sea level) gets a box one zStepSize high that ends at the top, so its cell is
+        covered too. Cells without a normal brick are left empty.
+
+        :param store: placementStore with all placed instances
+        :param zStepSize: vertical interval of the normal bricks in heightMap depth
+        :param worldScale: scale of the world: one brick unit equals world scale in meters
+        :return: number of boxes
+        """
+        import bricks
+
+        tops = store.topHeights(self.worldSize, zStepSize)
+        sink = instanceSink(bricks.outputDirectory + '/' + LOD_NAME + "/items.level.json", LOD_NAME,
+                            formats=bricks.outputFormats, compression=bricks.outputCompression)
+        numBoxes = 0
+        for cellX, cellY in np.argwhere(self.far).tolist():
+            startX, startY = cellX * self.cellSize, cellY * self.cellSize
+            cell = tops[startX:startX + self.cellSize, startY:startY + self.cellSize]
+            # topHeights marks the cells without a normal brick with the lowest int64
+            rectangles = [rectangle for rectangle in uniformRectangles(cell) if rectangle[4] > np.iinfo(np.int64).min]
+            bottoms = [0 if rectangle[4] > 0 else rectangle[4] - zStepSize for rectangle in rectangles]
+            positions = [(round((startX + rectangle[0] + self.worldOffset[0]) * worldScale[0], 3),
+                          round((startY + rectangle[2] + self.worldOffset[1]) * worldScale[1], 3),
+                          round((bottom + self.worldOffset[2]) * worldScale[2], 4))
+                         for rectangle, bottom in zip(rectangles, bottoms)]
+            scaleTexts = [f'"scale":[{(rectangle[1] - rectangle[0]) * worldScale[0]},'
+                          f'{(rectangle[3] - rectangle[2]) * worldScale[1]},'
+                          f'{(rectangle[4] - bottom) * worldScale[2]}],' for rectangle, bottom in zip(rectangles, bottoms)]
+            sink.addMany(positions, [''] * len(positions), scaleTexts, [self.boxObject] * len(positions))
+            numBoxes += len(positions)
+        sink.close()
+        sharedProfiler.count("lodBoxes", numBoxes)
+        sharedProfiler.log(f'lod: {int(self.far.sum())} of {self.far.size} cells replaced by {numBoxes} boxes')
+        return numBoxes
+
+
+# shared by all bricks
+sharedLod = lodGrid()
@@ -1,171 +1,337 @@
-from materials import material
-from trees import treeType
+from materials import material, materialTypeArray
+from configs import sharedConfigs
+from trees import treeType, placeForest
+from fitting import fitTable
+from packing import PACKING_MODES, packBricks
+from walls import placeWalls
+from tiling import placeTiled
+from streaming import prepareMaps, placeStreaming
+from preprocessing import roadMask, brickHeadroom, preprocessHeights
+from rotations import sharedRotations, sharedRoadSlopes
+from instrumentation import sharedProfiler
+from placements import sharedPlacements
+from grids import gridState
+from maps import mapShape, imageStrips, checkShapes, readHeightMap, hasAlpha
+from lod import sharedLod
+from randomness import sharedRandom
+from output import OUTPUT_FORMATS, COMPRESSIONS, WRITE_QUEUE_SIZE, sharedWriter, zstandard, closeAll
+import bricks
+import packing
 import numpy as np
-from PIL import Image
-from random import randrange, seed
 from json import load
-from time import time_ns, time
+from time import time
 
 
-def place(displacementGrid, materialGrid: [[material]], materials: [material], worldScale: [float, float, float],
+def place(displacementGrid, materialGrid: np.ndarray, materials: [material], worldScale: [float, float, float],
           worldOffset: [float, float, float], zStepSize: int):
     size = (len(displacementGrid), len(displacementGrid[0]))
-    finishedGrid = np.array([[False] * size[1]] * size[0])
-    brickHeightGrid = np.copy(displacementGrid) #np.empty([size[0], size[1]], dtype=int)
-    for x in range(size[0]):
-        startTimer = time()
-        y = 0
-        while y < size[1]:
+    brickHeightGrid = placeBricks(displacementGrid, materialGrid, materials, worldScale, worldOffset, zStepSize)
+    placeWallBricks(displacementGrid, brickHeightGrid, size, worldScale, worldOffset, zStepSize, materialGrid, materials)
+    placeWallBricks(displacementGrid, brickHeightGrid, size, worldScale, worldOffset, zStepSize, materialGrid, materials,
+                    True)
+    return brickHeightGrid
+
+def placeBricks(displacementGrid, materialGrid: np.ndarray, materials: [material], worldScale: [float, float, float],
+                worldOffset: [float, float, float], zStepSize: int, area: (int, int, int, int) = None) -> np.ndarray:
+    """
+    Places all normal bricks row by row.
+
+    :param materialGrid: Grid of material indexes, see convertToMaterial
+    :param area: (startX, endX, startY, endY). If given only bricks that lie completely inside this area are placed,
+     the cells around it are only used to look up neighbours.
+    :return: brickHeightGrid: height of the terrain with all bricks placed
+    """
+    size = (len(displacementGrid), len(displacementGrid[0]))
+    area = area or (0, size[0], 0, size[1])
+    state = gridState(displacementGrid, area, brickHeadroom(materials, zStepSize))
+    with sharedProfiler.stage("place"):
+        placeRows(displacementGrid, materialGrid, materials, worldScale, worldOffset, zStepSize, state.finished,
+                  state.heights, area)
+    # the walls and the tiles only read the heights, the occupancy is kept as a bitset from now on
+    state.packFinished()
+    state.report()
+    return state.heights
+
+def placeRows(displacementGrid, materialGrid: np.ndarray, materials: [material], worldScale: [float, float, float],
+              worldOffset: [float, float, float], zStepSize: int, finishedGrid: np.ndarray, brickHeightGrid: np.ndarray,
+              area: (int, int, int, int), progress: bool = True):
+    """
+    Places the normal bricks anchored inside the area on top of already placed ones. Bricks may reach out of the area
+    unless the cells there are marked as finished.
+
+    :param finishedGrid: Grid of boolean that present on which coordinates a bricks has already been placed
+    :param brickHeightGrid: height of the terrain with all bricks placed so far
+    :param area: (startX, endX, startY, endY) of the cells at which bricks are anchored
+    :param progress: report the progress of the rows to the profiler
+    """
+    size = (len(displacementGrid), len(displacementGrid[0]))
+    materialTypes = materialTypeArray(materials)
+    fits = fitTable(displacementGrid, materialGrid, materials)
+    if packing.packingMode == "cost":
+        for x, y, i, j in packBricks(fits, displacementGrid, materialGrid, materials, finishedGrid, area):
+            mat = materials[i]
+            brickIndex, footprintSize, rotation = mat.orientations[j]
+            mat.bricks[brickIndex].triedBricks += 1
+            mat.placeBrick(mat.bricks[brickIndex], (x, y), size, displacementGrid, brickHeightGrid, finishedGrid,
+                           zStepSize, worldScale, worldOffset, (footprintSize, rotation))
+    for x in range(area[0], area[1]):
+        y = area[2]
+        while y < area[3]:
             if not finishedGrid[x,y]:
-                y += materialGrid[x][y].testBricks(materialGrid, (x, y), size, displacementGrid, brickHeightGrid,
-                                                   finishedGrid, zStepSize, worldScale, worldOffset)
+                mat = materials[materialGrid[x, y]]
+                if fits.supported[materialGrid[x, y]]:
+                    y += mat.testFittingBricks(fits, (x, y), size, displacementGrid, brickHeightGrid, finishedGrid,
+                                               zStepSize, worldScale, worldOffset)
+                else:
+                    y += mat.testBricks(materialGrid, materialTypes, (x, y), size, displacementGrid, brickHeightGrid,
+                                        finishedGrid, zStepSize, worldScale, worldOffset, fits.slope((x, y)))
             else:
                 y += 1
-        print(f'for Row {x}: {round(time()-startTimer, 4)} sec.')
-    placeWallBricks(displacementGrid, brickHeightGrid, size, worldScale, worldOffset, zStepSize, materialGrid)
-    placeWallBricks(displacementGrid, brickHeightGrid, size, worldScale, worldOffset, zStepSize, materialGrid, True)
+        if progress:
+            sharedProfiler.progress("place", x - area[0] + 1, area[1] - area[0])
 
 def placeWallBricks(displacementGrid, brickHeightGrid, size, worldScale, worldOffset, zStepSize,
-                    materialGrid: [[material]], LOCALXAXIS: bool = False):
-    for x in range(size[LOCALXAXIS]-1):
-        startTimer = time()
-        displacementUpperLimitRow = np.array([row[x] for row in brickHeightGrid]) if LOCALXAXIS else brickHeightGrid[x]
-        displacementBottomLimitRow = np.array([row[x] for row in displacementGrid]) if LOCALXAXIS \
-            else np.copy(displacementGrid[x])
-        neighbourDispUpperLimitRow = np.array([row[x + 1] for row in brickHeightGrid]) if LOCALXAXIS \
-            else brickHeightGrid[x + 1]
-        neighbourDispBottomLimitRow = np.array([row[x + 1] for row in displacementGrid]) if LOCALXAXIS \
-            else np.copy(displacementGrid[x + 1])
-        materialRow = np.array([row[x] for row in materialGrid]) if LOCALXAXIS else materialGrid[x]
-        y = 0
-        while y < (size[not LOCALXAXIS]):
-            materialGrid[x][y].testWallBricks(displacementUpperLimitRow, displacementBottomLimitRow,
-                                              neighbourDispUpperLimitRow, neighbourDispBottomLimitRow,
-                                              materialRow, y, (y if LOCALXAXIS else x, x if LOCALXAXIS else y), worldScale, worldOffset, zStepSize, LOCALXAXIS)
-            y += 1
-        print(f'for Row {x}: {round(time() - startTimer, 4)} sec.')
-        
+                    materialGrid: np.ndarray, materials: [material], LOCALXAXIS: bool = False):
+    with sharedProfiler.stage("walls"):
+        holes = placeWalls(displacementGrid, brickHeightGrid, materialGrid, materials, worldScale, worldOffset,
+                           zStepSize, LOCALXAXIS)
+    sharedProfiler.log(f'walls along {"y" if LOCALXAXIS else "x"}: {holes} holes')
+
 def saveJsons(materials:[material], treeList:[treeType]):
+    closeAll([br.sink for mat in materials for br in mat.builtBrickList()] +
+             [tree.sink for trees in treeList for tree in trees.trees])
+
+def printStatistics(materials: [material], startTimePlacing: float):
+    totalNumBricks = 0
     for mat in materials:
-        for br in mat.bricks:
-            br.closeJson()
-    for trees in treeList:
-        for tree in trees.trees:
-            tree.closeJson()
-
-def convertToMaterial(imagePath: str, materials: [], default: int = -1) -> list:
-    image = np.asarray(Image.open(imagePath))
-    # image = np.array([[[0, 146, 71]]*16]*16, np.uint8)
-    # print(image)
-    dict = {}
+        stats = mat.statistics()
+        sharedProfiler.log(stats)
+        totalNumBricks += list(stats.values())[0]["total"]
+    sharedProfiler.log(sharedRotations.statistics())
+    if "heightsGridBytes" in sharedProfiler.counters:
+        sharedProfiler.log(f'grid state: {sharedProfiler.counters["heightsGridBytes"]} bytes of heights, '
+                           f'{sharedProfiler.counters["finishedGridBytes"]} bytes of occupancy')
+    sharedProfiler.log(f"in total {totalNumBricks} bricks placed in {time()-startTimePlacing} sec.")
+
+def packColors(colors: np.ndarray) -> np.ndarray:
+    """
+    :param colors: array of RGB or RGBA colors with the color channels in the last axis
+    :return: uint32 array with every color packed into one integer, the alpha of RGBA colors in the lowest byte
+    """
+    colors = colors.astype(np.uint32)
+    packed = colors[..., 0] << 16 | colors[..., 1] << 8 | colors[..., 2]
+    if colors.shape[-1] == 4:
+        packed = packed << 8 | colors[..., 3]
+    return packed
+
+def convertToMaterial(imagePath: str, materials: [], default: int = None, out: np.ndarray = None) -> np.ndarray:
+    """
+    Converts the texture map into a grid of material indexes, strip by strip (see maps.imageStrips) so only one strip
+    of colors is kept in memory besides the decoded image.
+
+    :param imagePath: path of the texture map
+    :param materials: list of materials (or treeTypes), each with the RGB color it has on the texture map
+    :param default: index used for colors that don't belong to any material. If not given an unknown color raises an
+     exception
+    :param out: array the indexes are written to, e.g. a memory-mapped .npy file, see materialIndexType. Default: a new
+     array
+    :return: uint8 array (uint16 for more than 256 materials) of indexes into materials
+    """
+    # if two materials have the same color the last one is used. Texture maps with an alpha channel are matched with
+    # the alpha of the colors, colors without alpha are opaque
+    alpha = hasAlpha(imagePath)
+    colorIndex = {}
     for i in range(len(materials)):
-        dict.update({materials[i].color: i})
-    print(dict)
-    print("0,0:", image[0,0].tobytes())
-    materialGrid = [[materials[dict.get(image[x][y].tobytes(), default)] for y in range(len(image[0]))] for x in range(len(image))]
-    return materialGrid
-
-def placeTrees(displacementGrid, treeTypeGrid, trees: [treeType], worldScale: [float, float, float]):
-    seed(0)
-    worldSize = (len(displacementGrid), len(displacementGrid[0]))
+        color = np.frombuffer(materials[i].color, np.uint8)
+        if alpha:
+            color = np.append(color[:3], color[3] if len(color) > 3 else 255)
+        colorIndex[int(packColors(color[:3 + alpha]))] = i
+    colors = np.array(sorted(colorIndex), np.uint32)
+    indexes = np.array([colorIndex[color] for color in sorted(colorIndex)], materialIndexType(materials))
+    if out is None:
+        out = np.empty(mapShape(imagePath), indexes.dtype)
+
+    # number of pixels, first pixel and smallest and largest x and y of every unknown color
+    unknown = {}
+    for start, strip in imageStrips(imagePath, alpha=alpha):
+        keys = packColors(strip)
+        position = np.minimum(np.searchsorted(colors, keys), len(colors) - 1)
+        known = colors[position] == keys
+        out[start:start + len(keys)] = np.where(known, indexes[position], default if default is not None else 0)
+        if known.all():
+            continue
+        for color, count in zip(*np.unique(keys[~known], return_counts=True)):
+            pixels = np.argwhere(keys == color) + (start, 0)
+            (minX, minY), (maxX, maxY) = pixels.min(axis=0), pixels.max(axis=0)
+            if int(color) not in unknown:
+                unknown[int(color)] = [0, tuple(int(i) for i in pixels[0]), minX, maxX, minY, maxY]
+            entry = unknown[int(color)]
+            entry[0] += int(count)
+            entry[2:] = min(entry[2], minX), max(entry[3], maxX), min(entry[4], minY), max(entry[5], maxY)
+    if unknown:
+        shifts = (24, 16, 8, 0) if alpha else (16, 8, 0)
+        report = "\n".join(f'    color {[color >> shift & 255 for shift in shifts]}: {count} pixels, '
+                           f'first at {first}, inside x {minX}-{maxX} and y {minY}-{maxY}'
+                           for color, (count, first, minX, maxX, minY, maxY) in sorted(unknown.items()))
+        if default is None:
+            raise ValueError(f"colors of {imagePath} without material:\n{report}")
+        print(Warning(f"colors of {imagePath} without material, using {default}:\n{report}"))
+    return out
+
+def materialIndexType(materials: []) -> type:
+    """
+    :return: type of the material indexes of convertToMaterial
+    """
+    return np.uint8 if len(materials) <= 256 else np.uint16
+
+def placeTrees(displacementGrid, treeTypeGrid, trees: [treeType], worldScale: [float, float, float],
+               worldOffset: [float, float, float] = (0, 0, 0), occupiedGrid: np.ndarray = None, randomSeed: int = 0,
+               processes: int = None):
+    """
+    Places the trees of all tree types with placeForest and writes them.
+
+    :param occupiedGrid: boolean grid, True where no tree may stand (e.g. roads)
+    :param randomSeed: seed of the tree positions, the shapes are drawn by sharedRandom
+    :param processes: number of processes the tree types are placed in
+    """
+    displacementGrid = np.asarray(displacementGrid)
+    worldSize = displacementGrid.shape
+    forest = placeForest(displacementGrid, np.asarray(treeTypeGrid), trees, occupiedGrid, randomSeed, processes)
     numTrees = 0
-    #mainloop
-    i = 0
-    for tree in trees:
-        for x in range(0, worldSize[0], tree.density[0]):
-            for y in range(0, worldSize[1], tree.density[1]):
-                localX = x + randrange(0, tree.density[0])
-                localY = y + randrange(0, tree.density[1])
-                if localX >= worldSize[0] or localY >= worldSize[1]:
-                    break
-                checkedTrees = [False]*tree.numTrees
-                checkedTreesNum = 0
-                if treeTypeGrid[localX][localY] == i:
-                    while checkedTreesNum < tree.numTrees:
-                        r = randrange(0, tree.numTrees)
-                        rotation = randrange(0, 360, 90)
-                        if not checkedTrees[r]:
-                            checkedTrees[r] = True
-                            checkedTreesNum += 1
-                            result = tree.trees[r].treeTest((localX, localY), worldSize, displacementGrid)
-                            if result:
-                                tree.trees[r].redefineBrick((localX, localY, displacementGrid[localX][localY]), worldScale,
-                                                     rotation)
-                                numTrees += 1
-                                break
-        i += 1
-    print(numTrees)
+    for tree, placed in zip(trees, forest):
+        for x, y, r, rotation in placed.tolist():
+            tree.trees[r].redefineBrick(displacementGrid, (x, y, displacementGrid[x, y]), worldScale, worldOffset,
+                                        worldSize, zRotation=rotation)
+        numTrees += len(placed)
+    sharedProfiler.count("trees", numTrees)
+
+
+def configureLod(config: dict, worldSize: (int, int), worldOffset: [float, float, float]):
+    """
+    Enables the lod stage if the config has a "lod" entry, see lod.lodGrid.
+    """
+    if config.get("lod"):
+        sharedLod.configure(config["lod"].get("cellSize", 64), config["lod"].get("focusAreas", []),
+                            config["lod"]["boxObject"], worldSize, worldOffset)
 
 
 if __name__ == '__main__':
 
     config = load(open("config.json"))
+    sharedProfiler.verbose = config.get("verbose", False)
+    sharedProfiler.enable(config.get("profileCpu", False), config.get("profileMemory", False))
+    bricks.outputFormats = tuple(config.get("outputFormats", ["json"]))
+    if any(outputFormat not in OUTPUT_FORMATS for outputFormat in bricks.outputFormats):
+        raise ValueError(f"unknown outputFormats {bricks.outputFormats}, use any of {OUTPUT_FORMATS}")
+    bricks.outputCompression = config.get("compression")
+    if bricks.outputCompression is not None and bricks.outputCompression not in COMPRESSIONS:
+        raise ValueError(f"unknown compression {bricks.outputCompression}, use one of {tuple(COMPRESSIONS)}")
+    if bricks.outputCompression == "zstd" and zstandard is None:
+        raise ValueError("the zstd compression needs the zstandard package")
+    if config.get("writeQueue", WRITE_QUEUE_SIZE):
+        sharedWriter.start(config.get("writeQueue", WRITE_QUEUE_SIZE))
+    packing.packingMode = config.get("packing", "greedy")
+    if packing.packingMode not in PACKING_MODES:
+        raise ValueError(f"unknown packing {packing.packingMode}, use one of {PACKING_MODES}")
+    packing.packingProcesses = config.get("processes") or 1
+    sharedRandom.configure(config.get("seed", 0))
+
+    # both maps need the same size, checked before any of them is decoded
+    checkShapes(config["heightMapPath"], config["textureMapPath"], config.get("heightMapShape"))
+    if config.get("treesConfigPath"):
+        checkShapes(config["heightMapPath"], config["treeMapPath"], config.get("heightMapShape"))
 
     # load materials
-    print("loading materials...", end=' ')
-    start = time_ns()
-    tex = [material((f'materials/' + path)) for path in config["materialPaths"]]
-    #tex = [material(("materials/exampleMaterial.json"))]
-    print(time_ns()-start, "nanosec for", len(tex), "materials")
+    with sharedProfiler.stage("load"):
+        materialPaths = [f'materials/' + path for path in config["materialPaths"]]
+        if config.get("configCachePath"):
+            sharedConfigs.open(config["configCachePath"])
+        sharedConfigs.validate(materialPaths)
+        tex = [material(path) for path in materialPaths]
+        sharedConfigs.save()
 
     # define Worldscale
     stepSize = int(config["stepSize"])
     scale = config["worldscale"]
     scale[2] = scale[2]/stepSize
-    print(stepSize)
+
+    sharedRoadSlopes.precompute(scale, stepSize, [brick["size"] for mat in tex for brick in mat.brickTable
+                                                  if brick["type"] == "road"])
+
+    if config.get("bandSize"):
+        if config.get("treesConfigPath"):
+            print(Warning("no trees are placed with bandSize, the heights of the bricks are only kept band by band"))
+        # place bricks band by band from the converted maps
+        with sharedProfiler.stage("convert"):
+            heightMap, materialMap = prepareMaps(config["heightMapPath"], config["textureMapPath"], tex,
+                                                 materialPaths, config.get("heightMapShape"))
+        worldOffset = config.get("worldOffset", [-len(heightMap)/2, -len(heightMap[0])/2, 0])
+        configureLod(config, heightMap.shape, worldOffset)
+        startTimePlacing = time()
+        placeStreaming(heightMap, materialMap, tex, scale, worldOffset, stepSize, config["bandSize"],
+                       config.get("roadSmoothing", 0), config.get("minHeight"), config.get("maxHeight"))
+        printStatistics(tex, startTimePlacing)
+        if config.get("validate"):
+            for problem in sharedPlacements.validate(heightMap.shape):
+                print(Warning(problem))
+        if sharedLod.enabled:
+            with sharedProfiler.stage("lod"):
+                sharedLod.writeFarCells(sharedPlacements, stepSize, scale)
+        with sharedProfiler.stage("write"):
+            saveJsons(tex, [])
+        if config.get("reportPath"):
+            sharedProfiler.save(config["reportPath"], tex)
+        exit()
 
     # load heightMap
-    print("loading displacement map")
-    displacementGrid = np.asarray(Image.open(config["heightMapPath"]))
-    #displacementGrid = np.array([[32 * y for y in range(4)] for x in range(4)])
-    #displacementGrid = np.array([[0, 0, 0],
-    #                             [0, 128, 0],
-    #                             [0, 0, 0]])
-    #                             [0, 128, 0, 0, 128, 0],
-    #                             [0, 128, 128, 128, 128, 0],
-    #                             [0, 0, 0, 0, 0, 0]])
-    #print(displacementGrid)
+    with sharedProfiler.stage("load"):
+        displacementGrid = readHeightMap(config["heightMapPath"], config.get("heightMapShape"))
 
     # load textureMap
-    print("loading material map")
-    #grid = [[tex[0]]*3]*3
-    grid = convertToMaterial(config["textureMapPath"], tex)
+    with sharedProfiler.stage("convert"):
+        grid = convertToMaterial(config["textureMapPath"], tex)
 
     # redefine displacement map
-    print("redefining displacement map")
-    for x in range(len(displacementGrid)):
-        for y in range(len(displacementGrid[0])):
-            if not grid[x][y].materialType == "road":
-                displacementGrid[x][y] = int(displacementGrid[x][y] / stepSize) * stepSize
+    with sharedProfiler.stage("quantize"):
+        displacementGrid = preprocessHeights(displacementGrid, roadMask(grid, tex), stepSize,
+                                             config.get("roadSmoothing", 0), config.get("minHeight"),
+                                             config.get("maxHeight"), brickHeadroom(tex, stepSize))
 
     # define global offset
     worldOffset = config.get("worldOffset", [-len(displacementGrid)/2, -len(displacementGrid[0])/2, 0])
+    configureLod(config, displacementGrid.shape, worldOffset)
 
     # place Bricks
-    print("placing bricks")
     startTimePlacing = time()
-    place(displacementGrid, grid, tex, scale, worldOffset, stepSize)
-
-    totalNumBricks = 0
-    for material in tex:
-        stats = material.statistics()
-        print(stats)
-        totalNumBricks += list(stats.values())[0]["total"]
-    print(f"in total {totalNumBricks} bricks placed in {time()-startTimePlacing} sec.")
-    exit()
-
-    # load trees
-    print("loading trees")
-    file = open('treesConfig.json')
-    data = load(file)
-    trees = [treeType(e) for e in data]
-    print("loading tree map")
-    treeGrid = convertToMaterial("exampleTextureMap_2.png", trees)
+    if config.get("tileSize"):
+        brickHeightGrid = placeTiled(displacementGrid, grid, tex, materialPaths, scale, worldOffset, stepSize,
+                                     config["tileSize"], config.get("seed", 0), config.get("processes"),
+                                     config.get("tileCachePath"))
+    else:
+        brickHeightGrid = place(displacementGrid, grid, tex, scale, worldOffset, stepSize)
 
-    #place Trees
-    print("placing trees")
-    placeTrees(displacementGrid, treeGrid, trees, scale)
+    printStatistics(tex, startTimePlacing)
+    if config.get("validate"):
+        for problem in sharedPlacements.validate(displacementGrid.shape):
+            print(Warning(problem))
 
-    print("writing to disc")
-    saveJsons([], trees)
+    # place trees on top of the bricks
+    trees = []
+    if config.get("treesConfigPath"):
+        with sharedProfiler.stage("load"):
+            with open(config["treesConfigPath"]) as file:
+                trees = [treeType(e) for e in load(file)]
+        with sharedProfiler.stage("convert"):
+            # cells of other colors get no tree
+            treeGrid = convertToMaterial(config["treeMapPath"], trees, len(trees))
+        with sharedProfiler.stage("trees"):
+            placeTrees(brickHeightGrid, treeGrid, trees, scale, worldOffset, roadMask(grid, tex),
+                       config.get("seed", 0), config.get("processes"))
 
+    if sharedLod.enabled:
+        with sharedProfiler.stage("lod"):
+            sharedLod.writeFarCells(sharedPlacements, stepSize, scale)
+    with sharedProfiler.stage("write"):
+        saveJsons(tex, trees)
+    if config.get("reportPath"):
+        sharedProfiler.save(config["reportPath"], tex)
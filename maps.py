@@ -0,0 +1,171 @@
+import os
+import numpy as np
+from PIL import Image
+
+# number of rows that are converted at once
+STRIP_ROWS = 1024
+# modes of grayscale height maps and the type of their heights
+HEIGHT_MODES = {"L": np.uint8, "I;16": np.uint16, "I;16L": np.uint16, "I;16B": np.uint16, "I;16N": np.uint16,
+                "I": np.int32}
+# raw modes of uncompressed tiles (TIFF strips and tiles) that are read from the file directly
+RAW_TYPES = {"L": "u1", "I;16": "<u2", "I;16L": "<u2", "I;16B": ">u2", "I;16N": "=u2"}
+# modes of texture maps with an alpha channel, their alpha is part of the color of a material
+ALPHA_MODES = ("RGBA", "RGBa", "LA", "La", "PA")
+# headerless heightfields of little-endian 16 bit heights, row by row
+RAW_EXTENSIONS = (".raw", ".r16")
+
+
+def openImage(path: str) -> Image.Image:
+    """
+    Opens a map lazily, only its header is read. Big maps have more pixels than the decompression bomb check of PIL
+    allows, so it is skipped for them.
+    """
+    limit, Image.MAX_IMAGE_PIXELS = Image.MAX_IMAGE_PIXELS, None
+    try:
+        return Image.open(path)
+    finally:
+        Image.MAX_IMAGE_PIXELS = limit
+
+
+def rawShape(path: str, shape: (int, int) = None) -> (int, int):
+    """
+    :param path: path of a headerless heightfield
+    :param shape: rows and columns. Default: square, from the size of the file
+    """
+    if shape is not None:
+        return int(shape[0]), int(shape[1])
+    side = int(round((os.path.getsize(path) // 2) ** 0.5))
+    if side * side * 2 != os.path.getsize(path):
+        raise ValueError(f"{path} is not square, set heightMapShape to its rows and columns")
+    return side, side
+
+
+def mapShape(path: str, shape: (int, int) = None) -> (int, int):
+    """
+    Reads the shape of a map without decoding it.
+
+    :param path: path of an image, a .npy file or a headerless heightfield (see RAW_EXTENSIONS)
+    :param shape: shape of a headerless heightfield, see rawShape
+    :return: number of rows and columns
+    """
+    if path.endswith(".npy"):
+        return tuple(np.load(path, mmap_mode="r").shape[:2])
+    if path.endswith(RAW_EXTENSIONS):
+        return rawShape(path, shape)
+    with openImage(path) as image:
+        return image.size[1], image.size[0]
+
+
+def checkShapes(heightMapPath: str, textureMapPath: str, shape: (int, int) = None):
+    """
+    Checks that both maps have the same size before anything is loaded.
+
+    :param shape: shape of a headerless height map, see rawShape
+    :raises ValueError: if they differ
+    """
+    heightShape, textureShape = mapShape(heightMapPath, shape), mapShape(textureMapPath)
+    if heightShape != textureShape:
+        raise ValueError(f"height map {heightMapPath} {heightShape} and texture map {textureMapPath} {textureShape} "
+                         f"differ in size")
+
+
+def heightMapType(path: str) -> np.dtype:
+    """
+    :return: type of the heights of a height map
+    :raises ValueError: if the image is not a grayscale image with 8, 16 or 32 bit
+    """
+    if path.endswith(".npy"):
+        return np.load(path, mmap_mode="r").dtype
+    if path.endswith(RAW_EXTENSIONS):
+        return np.dtype("<u2")
+    with openImage(path) as image:
+        if image.mode not in HEIGHT_MODES:
+            raise ValueError(f"height map {path} has mode {image.mode}, use a grayscale image with 8 or 16 bit")
+        return np.dtype(HEIGHT_MODES[image.mode])
+
+
+def rawTiles(image: Image.Image) -> bool:
+    """
+    :return: True if every tile of the image is stored uncompressed, e.g. the strips or tiles of an uncompressed TIFF
+    """
+    return all(tile[0] == "raw" and isinstance(tile[3], tuple) and tile[3][0] in RAW_TYPES and tile[3][2] in (1, -1)
+               for tile in image.tile)
+
+
+def readRawTile(file, tile, out: np.ndarray):
+    """
+    Reads one uncompressed tile from the file into its part of out.
+
+    :param tile: tile of a PIL image with the extents, offset and (raw mode, stride, orientation) of the tile
+    """
+    (startX, startY, endX, endY), offset, (rawMode, stride, orientation) = tile[1], tile[2], tile[3]
+    dtype = np.dtype(RAW_TYPES[rawMode])
+    width, rows = endX - startX, endY - startY
+    stride = stride or width * dtype.itemsize
+    file.seek(offset)
+    data = file.read((rows - 1) * stride + width * dtype.itemsize)
+    pixels = np.ndarray((rows, width), dtype, data, strides=(stride, dtype.itemsize))
+    out[startY:endY, startX:endX] = pixels[::orientation]
+
+
+def readHeightMap(path: str, shape: (int, int) = None, out: np.ndarray = None,
+                  stripRows: int = STRIP_ROWS) -> np.ndarray:
+    """
+    Loads a height map without keeping more than one decoded copy of it in memory:
+
+    * .npy files and headerless heightfields (see RAW_EXTENSIONS) are memory-mapped, nothing is decoded
+    * uncompressed TIFF files are read strip by strip or tile by tile straight into the result
+    * all other images (e.g. 16 bit PNG) are decoded by PIL and copied into the result in strips of stripRows rows
+
+    :param path: path of the height map
+    :param shape: shape of a headerless heightfield, see rawShape
+    :param out: array the heights are written to, e.g. a memory-mapped .npy file. Default: a new array
+    :param stripRows: number of rows that are copied at once
+    :return: grid of the heights, read-only if it is memory-mapped
+    :raises ValueError: if the image is not a grayscale image with 8, 16 or 32 bit
+    """
+    if path.endswith(".npy"):
+        return np.load(path, mmap_mode="r")
+    if path.endswith(RAW_EXTENSIONS):
+        return np.memmap(path, "<u2", "r", shape=rawShape(path, shape))
+    dtype = heightMapType(path)
+    with openImage(path) as image:
+        width, height = image.size
+        if out is None:
+            out = np.empty((height, width), dtype)
+        if rawTiles(image):
+            with open(path, "rb") as file:
+                for tile in image.tile:
+                    readRawTile(file, tile, out)
+            return out
+        image.load()
+        for start in range(0, height, stripRows):
+            end = min(start + stripRows, height)
+            out[start:end] = np.asarray(image.crop((0, start, width, end)))
+    return out
+
+
+def hasAlpha(path: str) -> bool:
+    """
+    :return: True if the image has an alpha channel or a transparent palette color
+    """
+    with openImage(path) as image:
+        return image.mode in ALPHA_MODES or (image.mode == "P" and "transparency" in image.info)
+
+
+def imageStrips(path: str, stripRows: int = STRIP_ROWS, alpha: bool = False):
+    """
+    :param path: path of an image
+    :param stripRows: number of rows of a strip
+    :param alpha: return RGBA pixels instead of RGB pixels, see hasAlpha
+    :return: generator of the first row and the RGB (or RGBA) pixels of every strip
+    """
+    mode = "RGBA" if alpha else "RGB"
+    with openImage(path) as image:
+        image.load()
+        width, height = image.size
+        for start in range(0, height, stripRows):
+            strip = image.crop((0, start, width, min(start + stripRows, height)))
+            if strip.mode != mode:
+                strip = strip.convert(mode)
+            yield start, np.asarray(strip)
@@ -1,5 +1,6 @@
-from json import load
+from configs import sharedConfigs
 from bricks import normalBrick, wallBrick
+from instrumentation import sharedProfiler
 import numpy as np
 
 
@@ -8,144 +9,194 @@ def nameFromPath(path: str) -> str:
     return name[len(name) - 1]
 
 
+def materialTypeArray(materials: list) -> np.ndarray:
+    """
+    :param materials: list of all materials
+    :return: array with the type of every material, so it can be looked up with the material indexes of a grid
+    """
+    return np.array([mat.materialType for mat in materials])
+
+
 class material:
     def __init__(self, materialConfigFilePath):
-        file = open(materialConfigFilePath)
-        data = load(file)
-        self.name = data.get("name", nameFromPath(materialConfigFilePath))
+        data = sharedConfigs.load(materialConfigFilePath)
+        self.name = data["name"] or nameFromPath(materialConfigFilePath)
         self.color = np.array(data["color"], np.uint8).tobytes()
-        if len(data["bricks"]) <= 0:
-            raise Exception("no bricks in material, you need at least a 1x1 brick")
-        self.bricks = [normalBrick(e) for e in data["bricks"]]
+        # compiled tables of the bricks (see configs.compileConfig), the brick objects are only built when they are
+        # used, see bricks and wallBricks
+        self.brickTable = data["bricks"]
+        self.wallBrickTable = data["wallBricks"]
+        self.builtBricks = None
+        self.builtWallBricks = None
 
         self.noWallBrick = False
-        if len(data.get("wallBricks", [])) <= 0:
+        if len(self.wallBrickTable) <= 0:
             self.noWallBrick = True
             print(Warning(f"no wall bricks in material: {self.name}, holes may appear"))
-        self.wallBricks = [wallBrick(e) for e in data.get("wallBricks", [])]
 
         self.maxSize = self.calcMaxSize()
-        self.materialType = data.get("type", "flat")
+        self.materialType = data["type"]
+        # bricks are tested in this order and the first one that fits is placed: the highest priority first, the
+        # larger one if two have the same. By default the priority is the position in the list, so the last fitting
+        # brick of the list is placed.
+        self.candidates = sorted(range(len(self.brickTable)), reverse=True, key=lambda i: (
+            self.brickTable[i]["priority"], self.brickTable[i]["size"][0] * self.brickTable[i]["size"][1]))
+        # footprints the cost packing (see packing.packBricks) tries: (brick index, (x, y), rotation in degrees), rotatable
+        # bricks that are not square also turned by 90 degrees
+        self.orientations = [(i, (brick["size"][0], brick["size"][1]), 0) for i, brick in enumerate(self.brickTable)]
+        self.orientations += [(i, (brick["size"][1], brick["size"][0]), 90) for i, brick in enumerate(self.brickTable)
+                              if brick["rotatable"] and brick["size"][0] != brick["size"][1]]
+        # scratch lists of the footprint tests (see normalBrick.footprintTest), reused for all coordinates
+        self.runs = {kind: ([0] * self.maxSize[0], [False] * self.maxSize[0]) for kind in ("flat", "road")}
+        self.emptyRuns = ([0] * self.maxSize[0], [False] * self.maxSize[0])
+        # number of cells at which no brick fit
+        self.failedFits = 0
+
+    @property
+    def bricks(self) -> [normalBrick]:
+        """
+        Bricks of the material, built from the brick table the first time they are used. Materials that are not on the
+        map never build them.
+        """
+        if self.builtBricks is None:
+            self.builtBricks = [normalBrick(e) for e in self.brickTable]
+        return self.builtBricks
+
+    @property
+    def wallBricks(self) -> [wallBrick]:
+        """
+        Wall bricks of the material, built from the wall brick table the first time they are used.
+        """
+        if self.builtWallBricks is None:
+            self.builtWallBricks = [wallBrick(e) for e in self.wallBrickTable]
+        return self.builtWallBricks
+
+    def builtBrickList(self) -> list:
+        """
+        :return: all bricks and wall bricks that were built, the others have no instances
+        """
+        return (self.builtBricks or []) + (self.builtWallBricks or [])
 
     def calcMaxSize(self) -> (int, int):
         maxSize = [0, 0]
-        for b in self.bricks:
-            if b.size[0] > maxSize[0]:
-                maxSize[0] = b.size[0]
-            if b.size[1] > maxSize[1]:
-                maxSize[1] = b.size[1]
-            if b.rotatable:
-                if b.size[1] > maxSize[0]:
-                    maxSize[0] = b.size[1]
-                if b.size[0] > maxSize[1]:
-                    maxSize[1] = b.size[0]
+        for b in self.brickTable:
+            if b["size"][0] > maxSize[0]:
+                maxSize[0] = b["size"][0]
+            if b["size"][1] > maxSize[1]:
+                maxSize[1] = b["size"][1]
+            if b["rotatable"]:
+                if b["size"][1] > maxSize[0]:
+                    maxSize[0] = b["size"][1]
+                if b["size"][0] > maxSize[1]:
+                    maxSize[1] = b["size"][0]
         return maxSize
 
     def statistics(self) -> dict:
-        stats = {brick.name: {"total": brick.placedBricks, "edgeBricks": brick.placedEdgeBricks,
-                              "flatBricks": brick.placedFlatBricks} for brick in self.bricks}
-        stats.update({brick.name: {"total": brick.placedBricks, "wallBricks": brick.placedBricks} for brick in self.wallBricks})
-
-        numBricks = {"total": 0, "edgeBricks": 0, "flatBricks": 0, "wallBricks": 0}
+        # bricks that were never built have no instances
+        stats = {brick["name"]: {"total": 0, "edgeBricks": 0, "flatBricks": 0, "tried": 0} for brick in self.brickTable}
+        stats.update({brick.name: {"total": brick.placedBricks, "edgeBricks": brick.placedEdgeBricks,
+                                   "flatBricks": brick.placedFlatBricks, "tried": brick.triedBricks}
+                      for brick in self.builtBricks or []})
+        stats.update({brick["name"]: {"total": 0, "wallBricks": 0} for brick in self.wallBrickTable})
+        stats.update({brick.name: {"total": brick.placedBricks, "wallBricks": brick.placedBricks}
+                      for brick in self.builtWallBricks or []})
+
+        numBricks = {"total": 0, "edgeBricks": 0, "flatBricks": 0, "wallBricks": 0, "tried": 0}
         for brick in stats.values():
             values = list(brick.values())
             keys = list(brick.keys())
             for i in range(len(values)):
                 numBricks[keys[i]] += values[i]
+        numBricks["failedFits"] = self.failedFits
 
         finalStats = {self.name: numBricks}
         finalStats.update(stats)
         return finalStats
 
-    def testBricks(self, materialGrid, coordinates: (int, int), size: [int, int], displacementGrid: np.ndarray,
-                   brickHeightGrid: np.ndarray, finishedGrid: [[bool]], zStepSize: int,
-                   worldScale: (float, float, float) = (1, 1, 1), worldOffset: (float, float, float) = (0, 0, 0)) -> int:
+    def testBricks(self, materialGrid: np.ndarray, materialTypes: np.ndarray, coordinates: (int, int),
+                   size: [int, int], displacementGrid: np.ndarray, brickHeightGrid: np.ndarray, finishedGrid: [[bool]],
+                   zStepSize: int, worldScale: (float, float, float) = (1, 1, 1),
+                   worldOffset: (float, float, float) = (0, 0, 0), slope: (int, int) = (0, 0)) -> int:
         """
         Defines which of all Bricks in this Material should be placed.
 
-        :param materialGrid:
+        :param materialGrid: Grid of material indexes
+        :param materialTypes: type of every material, see materialTypeArray
         :param coordinates:
         :param size: size of global world -> shape of material and displacementGrid
         :param displacementGrid:
         :param finishedGrid: Grid of boolean that present on which coordinates a bricks has already been placed
         :param worldScale:
         :param worldOffset:
+        :param slope: slope of the road in x and y direction at the coordinates, see fitTable.slope
         :return: length of placed Brick in y direction
         """
-        foundBrick = False
-        testedGrid = np.array([[False] * materialGrid[coordinates[0]][coordinates[1]].maxSize[1]] * materialGrid[coordinates[0]][coordinates[1]].maxSize[0])
-        for brick in self.bricks:
-            if brick.brickTest(coordinates, size, displacementGrid[coordinates[0]][coordinates[1]],
-                               materialGrid[coordinates[0]][coordinates[1]], displacementGrid, materialGrid,
-                               finishedGrid, testedGrid):
-                finalBrick = brick
-                foundBrick = True
-
-        if foundBrick:
-            finalBrick.redefineBrick(displacementGrid, (coordinates[0], coordinates[1], displacementGrid[coordinates[0]][coordinates[1]]),
-                                     worldScale, worldOffset, size)
-            for X in range(coordinates[0], coordinates[0] + finalBrick.size[0]):
-                for Y in range(coordinates[1], coordinates[1] + finalBrick.size[1]):
-                    finishedGrid[X, Y] = True
-                    brickHeightGrid[X, Y] += finalBrick.size[2] * zStepSize
-            return finalBrick.size[1]
-        else:
-            print(f"Could not find matching Brick at {coordinates} for {self.name}")
-            return 1
-
-    def testWallBricks(self, displacementUpperLimitRow, displacementBottomLimitRow, neighbourDispUpperLimitRow,
-                       neighbourDispBottomLimitRow, materialRow, COORDINATE, coordinates: (int, int),
-                       worldscale: (float, float, float), worldOffset, zStepSize, LOCALXAXIS):
+        for lengths, ended in self.runs.values():
+            lengths[:], ended[:] = self.emptyRuns
+        height = displacementGrid[coordinates[0]][coordinates[1]]
+        for i in self.candidates:
+            brick = self.bricks[i]
+            brick.triedBricks += 1
+            if brick.brickTest(coordinates, size, height, materialGrid[coordinates], displacementGrid, materialGrid,
+                               finishedGrid, self.runs, materialTypes, slope):
+                return self.placeBrick(brick, coordinates, size, displacementGrid, brickHeightGrid, finishedGrid,
+                                       zStepSize, worldScale, worldOffset, slope=slope)
+        self.failedFits += 1
+        sharedProfiler.log(f"Could not find matching Brick at {coordinates} for {self.name}")
+        return 1
 
+    def testFittingBricks(self, fits, coordinates: (int, int), size: [int, int], displacementGrid: np.ndarray,
+                          brickHeightGrid: np.ndarray, finishedGrid: np.ndarray, zStepSize: int,
+                          worldScale: (float, float, float) = (1, 1, 1),
+                          worldOffset: (float, float, float) = (0, 0, 0)) -> int:
         """
+        Same as testBricks, but uses the precomputed fitTable instead of testing every brick cell by cell. Only the
+        cells that got occupied by other bricks in the meantime have to be checked.
 
-        :param displacementUpperLimitRow: height of row with bricks placed
-        :param displacementBottomLimitRow: height of row with no bricks placed
-        :param neighbourDispUpperLimitRow: height of next row with bricks placed
-        :param neighbourDispBottomLimitRow: height of next row with no bricks placed
-        :param materialRow:
-        :param COORDINATE:
+        :param fits: fitTable of the world
         :param coordinates:
-        :param worldscale:
+        :param size: size of global world -> shape of material and displacementGrid
+        :param displacementGrid:
+        :param finishedGrid: Grid of boolean that present on which coordinates a bricks has already been placed
+        :param worldScale:
         :param worldOffset:
-        :param zStepSize:
-        :param LOCALXAXIS:
-        :return:
+        :return: length of placed Brick in y direction
         """
+        bits = int(fits.fitBits[coordinates])
+        for i in self.candidates:
+            if bits >> i & 1:
+                brick = self.bricks[i]
+                brick.triedBricks += 1
+                if not finishedGrid[coordinates[0]:coordinates[0] + brick.size[0],
+                                    coordinates[1]:coordinates[1] + brick.size[1]].any():
+                    return self.placeBrick(brick, coordinates, size, displacementGrid, brickHeightGrid,
+                                           finishedGrid, zStepSize, worldScale, worldOffset,
+                                           slope=fits.slope(coordinates) if brick.brickType == "road" else (0, 0))
+        self.failedFits += 1
+        sharedProfiler.log(f"Could not find matching Brick at {coordinates} for {self.name}")
+        return 1
 
-        def generateCoordiantes(height: np.ndarray, BACKFACING: bool):
-            # localaxis is changed
-            return (coordinates[0] + worldOffset[0] + (1 if (not LOCALXAXIS) and BACKFACING else 0),
-                    coordinates[1] + worldOffset[1] + (1 if LOCALXAXIS and BACKFACING else 0),
-                    height[COORDINATE] + worldOffset[2])
-
-        def test(bottomLimit: np.ndarray, upperLimit: np.ndarray, BACKFACING: bool):
-            while True:
-                finalBrick = False
-                if bottomLimit[COORDINATE] > upperLimit[COORDINATE]:
-                    for brick in self.wallBricks:
-                        if brick.brickTest(COORDINATE, self, bottomLimit, materialRow):
-                            finalBrick = brick
-                    if finalBrick:
-                        finalBrick.redefineBrick(generateCoordiantes(bottomLimit, BACKFACING), worldscale, LOCALXAXIS, BACKFACING)
-                        for x in range(COORDINATE, COORDINATE + finalBrick.size[0]):
-                            bottomLimit[x] -= finalBrick.size[2] * zStepSize
-                    else:
-                        print(f"NO MATCHING BRICK: \n"
-                              f"    Material: {self.name} \n"
-                              f"    Coordinates: {coordinates}, Height: {displacementBottomLimitRow[COORDINATE]} \n"
-                              f"    World Coordinates: {bottomLimit, generateCoordiantes(BACKFACING)}")
-                        break
-                else:
-                    break
-
-        if self.noWallBrick:
-            return 1
-
-        test(displacementBottomLimitRow, neighbourDispUpperLimitRow, False)
-        test(neighbourDispBottomLimitRow, displacementUpperLimitRow, True)
+    def placeBrick(self, finalBrick, coordinates: (int, int), size: [int, int], displacementGrid: np.ndarray,
+                   brickHeightGrid: np.ndarray, finishedGrid: np.ndarray, zStepSize: int,
+                   worldScale: (float, float, float), worldOffset: (float, float, float),
+                   orientation: ((int, int), int) = None, slope: (int, int) = (0, 0)) -> int:
+        """
+        Places the given brick at the coordinates and marks its footprint as finished.
 
-        return 1
+        :param orientation: footprint and rotation in degrees of the brick, see orientations. Default: not rotated
+        :param slope: slope of the road in x and y direction at the coordinates, road bricks are scaled and tilted to it
+        :return: length of placed Brick in y direction
+        """
+        footprintSize, zRotation = (finalBrick.size[0], finalBrick.size[1]), None
+        if orientation is not None:
+            footprintSize, zRotation = orientation
+        finalBrick.redefineBrick(displacementGrid, (coordinates[0], coordinates[1], displacementGrid[coordinates[0]][coordinates[1]]),
+                                 worldScale, worldOffset, size, footprintSize, slope, zRotation)
+        footprint = (slice(coordinates[0], coordinates[0] + footprintSize[0]),
+                     slice(coordinates[1], coordinates[1] + footprintSize[1]))
+        finishedGrid[footprint] = True
+        brickHeightGrid[footprint] += finalBrick.size[2] * zStepSize
+        return footprintSize[1]
 
 
 if __name__ == "__main__":
@@ -0,0 +1,410 @@
+import os
+import gzip
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from json import load, dump
+from queue import Queue
+from threading import Thread
+import numpy as np
+from instrumentation import sharedProfiler
+
+# zstandard is optional, it is only needed for the zstd compression
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# number of instances of one brick that are collected before they are written to its items.level.json
+BATCH_SIZE = 16384
+# formats the instances can be written in: "json" is the items.level.json of BeamNG, "binary" the records in
+# instances.bin with their tables in instances.json (see binaryPaths)
+OUTPUT_FORMATS = ("json", "binary")
+# one instance in instances.bin, little-endian
+RECORD_TYPE = np.dtype([("position", "<f8", (3,)), ("rotation", "<u4"), ("scale", "<u4"), ("shape", "<u4")])
+# compressions of the items.level.json with the suffix added to its name
+COMPRESSIONS = {"gzip": ".gz", "zstd": ".zst"}
+# number of batches that wait for the writer thread at most, see instanceWriter
+WRITE_QUEUE_SIZE = 8
+
+
+def binaryPaths(folder: str) -> (str, str):
+    """
+    :param folder: output folder of one brick
+    :return: paths of the records and of the json file with the tables
+    """
+    return os.path.join(folder, "instances.bin"), os.path.join(folder, "instances.json")
+
+
+def serializeInstances(parent: str, positions: [[float, float, float]], rotationIds: [int], scaleIds: [int],
+                       shapeIds: [int], rotations: [str], scales: [str], shapes: [str]) -> str:
+    """
+    :param parent: name of the brick, written as __parent
+    :param positions: positions of all instances
+    :param rotationIds: index into rotations of every instance
+    :param scaleIds: index into scales of every instance
+    :param shapeIds: index into shapes of every instance
+    :param rotations: formatted "rotationMatrix" entries
+    :param scales: formatted "scale" entries
+    :param shapes: paths of the DAE-Files
+    :return: the instances as newline-delimited json for BeamNG
+    """
+    prefix = '{"class":"TSStatic","__parent":"' + parent + '","position":['
+    return ''.join([f'{prefix}{x!r}, {y!r}, {z!r}],"isRenderEnabled":false,{scales[s]}{rotations[r]}'
+                    f'"shapeName":"{shapes[shape]}","useInstanceRenderData":true' '}\n'
+                    for (x, y, z), r, s, shape in zip(positions, rotationIds, scaleIds, shapeIds)])
+
+
+def openText(path: str, compression: str = None):
+    """
+    :param path: path of the file
+    :param compression: None or one of COMPRESSIONS
+    :return: text file opened for writing, compressed while it is written
+    """
+    if compression == "gzip":
+        return gzip.open(path, "wt")
+    if compression == "zstd":
+        if zstandard is None:
+            raise ImportError("the zstd compression needs the zstandard package")
+        return zstandard.open(path, "wt")
+    return open(path, "w")
+
+
+def readBinary(folder: str) -> (np.ndarray, dict):
+    """
+    :param folder: output folder of one brick
+    :return: memory-mapped records and the tables of the brick
+    """
+    recordPath, tablePath = binaryPaths(folder)
+    with open(tablePath) as file:
+        tables = load(file)
+    if not tables["count"]:
+        return np.empty(0, RECORD_TYPE), tables
+    return np.memmap(recordPath, RECORD_TYPE, "r", shape=(tables["count"],)), tables
+
+
+def convertBinary(folder: str, batchSize: int = BATCH_SIZE) -> int:
+    """
+    Writes the items.level.json of one brick from its binary output.
+
+    :param folder: output folder of one brick
+    :param batchSize: number of instances that are converted at once
+    :return: number of converted instances
+    """
+    records, tables = readBinary(folder)
+    with open(os.path.join(folder, "items.level.json"), "w") as file:
+        for start in range(0, len(records), batchSize):
+            batch = records[start:start + batchSize]
+            file.write(serializeInstances(tables["parent"], batch["position"].tolist(), batch["rotation"].tolist(),
+                                          batch["scale"].tolist(), batch["shape"].tolist(), tables["rotations"],
+                                          tables["scales"], tables["shapes"]))
+    return len(records)
+
+
+def convertDirectory(directory: str, processes: int = None) -> int:
+    """
+    Converts the binary output of all bricks in the output folder in parallel.
+
+    :param directory: output folder with one folder per brick
+    :param processes: number of worker processes. Default: number of cores
+    :return: number of converted instances
+    """
+    folders = sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                     if os.path.isfile(binaryPaths(os.path.join(directory, name))[1]))
+    with ProcessPoolExecutor(processes) as executor:
+        return sum(executor.map(convertBinary, folders))
+
+
+class instanceWriter:
+    def __init__(self):
+        """
+        Writes the batches of all sinks in a background thread: placing hands a full batch over and goes on while the
+        thread serializes, compresses and writes it. At most queueSize batches wait, if the queue is full placing waits
+        for the writer, so the memory of the waiting batches stays bounded. The jobs run in the order they were handed
+        over, so the files are the same as without the thread. Until start is called (and in processes forked from the
+        one that called it) every job runs right away.
+        """
+        self.queue = None
+        self.thread = None
+        self.processId = None
+        self.error = None
+
+    def start(self, queueSize: int = WRITE_QUEUE_SIZE):
+        """
+        :param queueSize: number of batches that wait for the writer at most
+        """
+        if self.thread is None:
+            self.queue = Queue(queueSize)
+            self.thread = Thread(target=self.run, name="instanceWriter", daemon=True)
+            self.processId = os.getpid()
+            self.thread.start()
+
+    def running(self) -> bool:
+        return self.thread is not None and self.processId == os.getpid()
+
+    def run(self):
+        while True:
+            job = self.queue.get()
+            try:
+                if job is None:
+                    return
+                # after an error the remaining jobs are skipped, the error is raised in the placing thread
+                if self.error is None:
+                    job[0](*job[1:])
+            except Exception as error:
+                self.error = error
+            finally:
+                self.queue.task_done()
+
+    def submit(self, function, *args):
+        """
+        Runs function with the arguments in the writer thread.
+        """
+        if not self.running():
+            function(*args)
+            return
+        self.raiseError()
+        if self.queue.full():
+            sharedProfiler.count("writeQueueWaits")
+        self.queue.put((function,) + args)
+
+    def join(self):
+        """
+        Waits until all jobs that were handed over are done.
+        """
+        if self.running():
+            self.queue.join()
+        self.raiseError()
+
+    def stop(self):
+        if self.running():
+            self.queue.put(None)
+            self.thread.join()
+        self.queue, self.thread, self.processId = None, None, None
+        self.raiseError()
+
+    def raiseError(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+
+# shared by all sinks
+sharedWriter = instanceWriter()
+
+
+class instanceSink:
+    def __init__(self, path: str, parent: str, batchSize: int = BATCH_SIZE, formats: [str] = ("json",),
+                 compression: str = None):
+        """
+        Collects the placed instances of one brick in columnar buffers and writes them batch-wise to its
+        items.level.json and/or as binary records. Rotation, scale and shape of an instance are only stored as an index
+        into a table of their (already formatted) texts. The output files and their folder are created when the first
+        batch is written, so bricks that are never placed don't create any file. Full batches are written by
+        sharedWriter, in a background thread if it was started.
+
+        :param path: path of the items.level.json, the binary files are written next to it
+        :param parent: name of the brick, written as __parent
+        :param batchSize: number of instances that are buffered before they are written
+        :param formats: any of OUTPUT_FORMATS
+        :param compression: None or one of COMPRESSIONS for the items.level.json, its suffix is added to the path
+        """
+        self.path = path + COMPRESSIONS.get(compression, "")
+        self.parent = parent
+        self.batchSize = batchSize
+        self.formats = formats
+        self.compression = compression
+        self.binaryPaths = binaryPaths(os.path.dirname(path))
+        self.binaryFile = None
+        self.numWritten = 0
+        self.length = 0
+        self.numInstances = 0
+        self.file = None
+        # buffers are allocated with the first instance
+        self.positions = None
+        self.rotationIds = None
+        self.scaleIds = None
+        self.shapeIds = None
+        # index 0 of rotations and scales means no rotation or scale
+        self.rotations, self.rotationIndex = [''], {'': 0}
+        self.scales, self.scaleIndex = [''], {'': 0}
+        self.shapes, self.shapeIndex = [], {}
+
+    @staticmethod
+    def tableId(table: list, index: dict, text: str) -> int:
+        i = index.get(text)
+        if i is None:
+            i = index[text] = len(table)
+            table.append(text)
+        return i
+
+    def add(self, position: [float, float, float], rotationText: str, scaleText: str, shapeName: str):
+        """
+        Adds one instance to the buffers.
+
+        :param position: position in world coordinates
+        :param rotationText: formatted "rotationMatrix" entry including the trailing comma or '' if not rotated
+        :param scaleText: formatted "scale" entry including the trailing comma or '' if not scaled
+        :param shapeName: path of the DAE-File
+        """
+        if self.positions is None:
+            self.positions = np.empty((self.batchSize, 3))
+            self.rotationIds = np.empty(self.batchSize, np.int32)
+            self.scaleIds = np.empty(self.batchSize, np.int32)
+            self.shapeIds = np.empty(self.batchSize, np.int32)
+        i = self.length
+        self.positions[i] = position
+        self.rotationIds[i] = self.tableId(self.rotations, self.rotationIndex, rotationText)
+        self.scaleIds[i] = self.tableId(self.scales, self.scaleIndex, scaleText)
+        self.shapeIds[i] = self.tableId(self.shapes, self.shapeIndex, shapeName)
+        self.length += 1
+        self.numInstances += 1
+        if self.length == self.batchSize:
+            self.flush()
+
+    def addMany(self, positions: [[float, float, float]], rotationTexts: [str], scaleTexts: [str], shapeNames: [str]):
+        """
+        Same as add for many instances at once.
+        """
+        start = 0
+        while start < len(positions):
+            if self.positions is None:
+                self.add(positions[start], rotationTexts[start], scaleTexts[start], shapeNames[start])
+                start += 1
+                continue
+            end = min(len(positions), start + self.batchSize - self.length)
+            i, j = self.length, self.length + end - start
+            self.positions[i:j] = positions[start:end]
+            self.rotationIds[i:j] = [self.tableId(self.rotations, self.rotationIndex, text)
+                                     for text in rotationTexts[start:end]]
+            self.scaleIds[i:j] = [self.tableId(self.scales, self.scaleIndex, text) for text in scaleTexts[start:end]]
+            self.shapeIds[i:j] = [self.tableId(self.shapes, self.shapeIndex, text) for text in shapeNames[start:end]]
+            self.length = j
+            self.numInstances += end - start
+            start = end
+            if self.length == self.batchSize:
+                self.flush()
+
+    def serialize(self, batch: (np.ndarray, np.ndarray, np.ndarray, np.ndarray)) -> str:
+        """
+        :param batch: positions, rotation, scale and shape ids of the instances, see flush
+        :return: the instances as newline-delimited json for BeamNG
+        """
+        positions, rotationIds, scaleIds, shapeIds = batch
+        return serializeInstances(self.parent, positions.tolist(), rotationIds.tolist(), scaleIds.tolist(),
+                                  shapeIds.tolist(), self.rotations, self.scales, self.shapes)
+
+    @staticmethod
+    def records(batch: (np.ndarray, np.ndarray, np.ndarray, np.ndarray)) -> np.ndarray:
+        """
+        :param batch: positions, rotation, scale and shape ids of the instances, see flush
+        :return: the instances as binary records
+        """
+        records = np.empty(len(batch[0]), RECORD_TYPE)
+        records["position"], records["rotation"], records["scale"], records["shape"] = batch
+        return records
+
+    def write(self, text: str):
+        """
+        Writes already serialized instances to the file, after everything that is still buffered.
+        """
+        self.flush()
+        if text:
+            sharedWriter.submit(self.writeText, text)
+
+    def writeText(self, text: str):
+        self.open()
+        self.file.write(text)
+
+    def writeBytes(self, data: bytes):
+        self.open()
+        self.binaryFile.write(data)
+
+    def writeRecords(self, records: np.ndarray, tables: dict):
+        """
+        Writes binary records of another sink of the same brick (see readBinary), after everything that is still
+        buffered.
+
+        :param records: records with indexes into the tables
+        :param tables: rotation, scale and shape tables of the other sink
+        """
+        self.flush()
+        if len(records):
+            records = np.array(records)
+            for field, table, index, other in (("rotation", self.rotations, self.rotationIndex, tables["rotations"]),
+                                               ("scale", self.scales, self.scaleIndex, tables["scales"]),
+                                               ("shape", self.shapes, self.shapeIndex, tables["shapes"])):
+                ids = np.array([self.tableId(table, index, text) for text in other], np.uint32)
+                records[field] = ids[records[field]]
+            sharedWriter.submit(self.writeBytes, records.tobytes())
+            self.numWritten += len(records)
+
+    def open(self):
+        if self.file is None and self.binaryFile is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            if "json" in self.formats:
+                self.file = openText(self.path, self.compression)
+            if "binary" in self.formats:
+                self.binaryFile = open(self.binaryPaths[0], "wb")
+
+    def flush(self):
+        """
+        Hands the buffered instances over to sharedWriter. The buffers go with them, the next instance allocates new
+        ones.
+        """
+        if self.length:
+            n = self.length
+            batch = (self.positions[:n], self.rotationIds[:n], self.scaleIds[:n], self.shapeIds[:n])
+            self.positions, self.rotationIds, self.scaleIds, self.shapeIds = None, None, None, None
+            self.numWritten += n
+            self.length = 0
+            sharedWriter.submit(self.writeBatch, batch)
+
+    def writeBatch(self, batch: (np.ndarray, np.ndarray, np.ndarray, np.ndarray)):
+        self.open()
+        if self.file is not None:
+            self.file.write(self.serialize(batch))
+        if self.binaryFile is not None:
+            self.binaryFile.write(self.records(batch).tobytes())
+
+    def close(self):
+        """
+        Writes everything that is still buffered, closes the files and waits until sharedWriter wrote them. Use closeAll
+        for many sinks.
+        """
+        closeAll([self])
+
+    def finish(self):
+        if self.file is None and self.binaryFile is None:
+            # remove the output of an earlier run, nothing was placed this time
+            for path in (self.path,) + self.binaryPaths:
+                if os.path.isfile(path):
+                    os.remove(path)
+            return
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if self.binaryFile is not None:
+            self.binaryFile.close()
+            self.binaryFile = None
+            with open(self.binaryPaths[1], "w") as file:
+                dump({"parent": self.parent, "count": self.numWritten, "rotations": self.rotations,
+                      "scales": self.scales, "shapes": self.shapes}, file)
+
+
+def closeAll(sinks: [instanceSink]):
+    """
+    Closes many sinks at once: everything they still buffer and their finish are handed over to sharedWriter first and
+    then it is waited once until it wrote all of them, instead of once per sink.
+    """
+    for sink in sinks:
+        sink.flush()
+        sharedWriter.submit(sink.finish)
+    sharedWriter.join()
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description="Writes the items.level.json of all bricks from their binary output.")
+    parser.add_argument("directory", nargs="?", default="jsonsOutput")
+    parser.add_argument("--processes", type=int, default=None)
+    arguments = parser.parse_args()
+    print(f"{convertDirectory(arguments.directory, arguments.processes)} instances converted")
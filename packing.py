@@ -0,0 +1,188 @@
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from fitting import uniformMask
+from regions import regionTable
+from instrumentation import sharedProfiler
+
+# "greedy": the row scan places the first fitting brick of every cell (see material.candidates). "cost": the bricks of
+# flat materials are packed by their cost per cell first, see packBricks
+PACKING_MODES = ("greedy", "cost")
+# used by placeRows, set from the config
+packingMode = "greedy"
+# number of processes the big regions are packed in, set from the config
+packingProcesses = 1
+# regions with at least this many cells are packed one by one, see packBricks
+REGION_MIN_CELLS = 64
+
+
+def packable(mat) -> bool:
+    """
+    :return: True if the bricks of the material only need a uniform footprint, so they can be packed in any order
+    """
+    return all(brick["type"] == "flat" for brick in mat.brickTable)
+
+
+def greedyCount(fits, materialGrid: np.ndarray, materials: list, packed: np.ndarray, finishedGrid: np.ndarray,
+                area: (int, int, int, int)) -> int:
+    """
+    Counts the instances the greedy row scan would place on the cells of the packed materials without placing them.
+
+    :param fits: fitTable of the world
+    :param packed: boolean array, True for the index of every packed material
+    :param finishedGrid: Grid of boolean that present on which coordinates a bricks has already been placed
+    :param area: (startX, endX, startY, endY) of the cells at which bricks are anchored
+    """
+    finished = np.copy(finishedGrid)
+    count = 0
+    for x in range(area[0], area[1]):
+        y = area[2]
+        while y < area[3]:
+            index = materialGrid[x, y]
+            length = 1
+            if not finished[x, y] and packed[index]:
+                bits = int(fits.fitBits[x, y])
+                mat = materials[index]
+                for i in mat.candidates:
+                    size = mat.bricks[i].size
+                    if bits >> i & 1 and not finished[x:x + size[0], y:y + size[1]].any():
+                        finished[x:x + size[0], y:y + size[1]] = True
+                        count += 1
+                        length = size[1]
+                        break
+            y += length
+    return count
+
+
+def orientationOrder(mat) -> [int]:
+    """
+    :return: indexes into material.orientations by their cost per cell, the larger one first if two are the same
+    """
+    return sorted(range(len(mat.orientations)), key=lambda j: (
+        mat.bricks[mat.orientations[j][0]].cost / (mat.orientations[j][1][0] * mat.orientations[j][1][1]),
+        -mat.orientations[j][1][0] * mat.orientations[j][1][1], j))
+
+
+def packRegion(region: np.ndarray, anchors: np.ndarray, sizes: [(int, int)]) -> ([(int, int, int)], np.ndarray):
+    """
+    Packs one region: every footprint is placed in the given order wherever it lies on free cells of the region, row
+    by row. As long as the whole bounding box is free a footprint is laid out as a lattice at once, which is the same
+    the row by row placing would do.
+
+    :param region: boolean mask of the free cells of the region inside its bounding box
+    :param anchors: boolean mask of the cells inside the bounding box at which bricks may be anchored
+    :param sizes: footprints in the order they are placed
+    :return: x and y inside the bounding box and index into sizes of every placed brick, mask of the cells that are
+     still free
+    """
+    free = region.copy()
+    placements = []
+    for j, size in enumerate(sizes):
+        if free.all() and anchors.all():
+            xs, ys = np.meshgrid(np.arange(0, free.shape[0] - size[0] + 1, size[0]),
+                                 np.arange(0, free.shape[1] - size[1] + 1, size[1]), indexing="ij")
+            placements += [(x, y, j) for x, y in zip(xs.ravel().tolist(), ys.ravel().tolist())]
+            free[:xs.shape[0] * size[0], :ys.shape[1] * size[1]] = False
+            continue
+        candidates = uniformMask(free, size) & free & anchors
+        if size == (1, 1):
+            free[candidates] = False
+            placements += [(x, y, j) for x, y in np.argwhere(candidates).tolist()]
+            continue
+        for x, y in np.argwhere(candidates).tolist():
+            # most candidates lie under a brick placed before, the anchor is checked first
+            if free[x, y] and free[x:x + size[0], y:y + size[1]].all():
+                free[x:x + size[0], y:y + size[1]] = False
+                placements.append((x, y, j))
+    return placements, free
+
+
+def packRegions(jobs: [(np.ndarray, np.ndarray, [(int, int)])]) -> [([(int, int, int)], np.ndarray)]:
+    """
+    packRegion for a batch of regions, run by the worker processes.
+    """
+    return [packRegion(*job) for job in jobs]
+
+
+def packBricks(fits, displacementGrid: np.ndarray, materialGrid: np.ndarray, materials: list,
+               finishedGrid: np.ndarray, area: (int, int, int, int)) -> [(int, int, int, int)]:
+    """
+    Packs the bricks of all flat materials inside the area so the sum of their cost is low: the orientations of all
+    bricks (see material.orientations) are taken by their cost per cell, the larger one first if two are the same
+    (see orientationOrder), and every orientation is placed wherever its footprint is uniform and still free, row by
+    row. With the default cost of 1 this places as many large bricks as possible and fills the gaps with the small
+    ones. The packed cells are marked in finishedGrid, all other cells are left to the row scan.
+
+    A brick never leaves the connected region of cells with the same height and material it is anchored in (see
+    regions.regionTable), so regions of at least REGION_MIN_CELLS cells are packed one by one in their bounding box,
+    the biggest first and in packingProcesses processes. The small ones are packed together on the whole grid.
+
+    :param fits: fitTable of the world, used for the comparison with the greedy row scan
+    :param finishedGrid: Grid of boolean that present on which coordinates a bricks has already been placed
+    :param area: (startX, endX, startY, endY) of the cells at which bricks are anchored
+    :return: x, y, material index and orientation index of every packed brick, ordered by x and y
+    """
+    window = (slice(area[0], area[1]), slice(area[2], area[3]))
+    present = np.zeros(len(materials), bool)
+    present[np.unique(materialGrid[window])] = True
+    packed = np.array([present[i] and packable(mat) for i, mat in enumerate(materials)], bool)
+    if not packed.any():
+        return []
+    greedy = greedyCount(fits, materialGrid, materials, packed, finishedGrid, area)
+
+    key = displacementGrid.astype(np.int64) * len(materials) + materialGrid.astype(np.int64)
+    anchors = np.zeros(finishedGrid.shape, bool)
+    anchors[window] = True
+    orders = {i: orientationOrder(materials[i]) for i in np.flatnonzero(packed).tolist()}
+    placements = []
+
+    table = regionTable(key)
+    regionMaterials = table.keys % len(materials)
+    big = np.flatnonzero(packed[regionMaterials] & (table.sizes >= REGION_MIN_CELLS))
+    big = np.array([region for region in big.tolist() if anchors[table.box(region)].any()], np.int64)
+    if len(big):
+        jobs = {}
+        for region in big.tolist():
+            box, mat = table.box(region), int(regionMaterials[region])
+            jobs[region] = (table.mask(region) & ~finishedGrid[box], anchors[box],
+                            [materials[mat].orientations[j][1] for j in orders[mat]])
+        if packingProcesses > 1 and len(big) > 1:
+            batches = [batch for batch in table.schedule(packingProcesses, big) if batch]
+            with ProcessPoolExecutor(len(batches)) as executor:
+                results = executor.map(packRegions, [[jobs[region] for region in batch] for batch in batches])
+                packedRegions = {region: result for batch, batchResults in zip(batches, results)
+                                 for region, result in zip(batch, batchResults)}
+        else:
+            packedRegions = {region: packRegion(*jobs[region]) for region in table.largestFirst(big).tolist()}
+        for region in big.tolist():
+            (startX, _, startY, _), mat = table.boxes[region], int(regionMaterials[region])
+            regionPlacements, free = packedRegions[region]
+            finishedGrid[table.box(region)] |= jobs[region][0] & ~free
+            placements += [(x + startX, y + startY, mat, orders[mat][j]) for x, y, j in regionPlacements]
+
+    small = np.ones(table.count, bool)
+    small[big] = False
+    small = small[table.labels]
+    # the materials never share a region, so they are packed one after the other
+    uniform = {}
+    for i, order in orders.items():
+        for j in order:
+            size = materials[i].orientations[j][1]
+            if size not in uniform:
+                uniform[size] = uniformMask(key, size)
+            candidates = uniform[size] & anchors & small & (materialGrid == i) & ~finishedGrid
+            if size == (1, 1):
+                finishedGrid[candidates] = True
+                placements += [(x, y, i, j) for x, y in np.argwhere(candidates).tolist()]
+                continue
+            for x, y in np.argwhere(candidates).tolist():
+                if not finishedGrid[x, y] and not finishedGrid[x:x + size[0], y:y + size[1]].any():
+                    finishedGrid[x:x + size[0], y:y + size[1]] = True
+                    placements.append((x, y, i, j))
+
+    placements.sort()
+    sharedProfiler.count("greedyInstances", greedy)
+    sharedProfiler.count("packedInstances", len(placements))
+    sharedProfiler.count("packedRegions", len(big))
+    sharedProfiler.log(f'packing: {len(placements)} instances instead of {greedy} '
+                       f'({greedy - len(placements)} fewer), {len(big)} regions packed one by one')
+    return placements
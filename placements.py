@@ -0,0 +1,238 @@
+import numpy as np
+from rotations import KEY_DECIMALS
+
+# number of placements the columns grow by at least
+GROW_SIZE = 65536
+
+
+class placementStore:
+    def __init__(self):
+        """
+        Compact record of all placed instances as a struct of arrays, one entry per instance:
+
+        * coordinates: int32 grid coordinates x, y and the height z in heightMap depth
+        * rotationIds: uint16 index into rotations (rotation around x, y and z in radians), uint32 once there are more
+          rotations than uint16 holds, see widen
+        * brickIds: uint16 index into bricks, uint32 once there are more bricks
+        * shapeIds: uint16 index into the linkedObject of the brick followed by its linkedFlatObject
+        * scales: float32 scale in x, y and z
+
+        Statistics, validation and other output formats work on these arrays instead of the written text.
+        """
+        self.enabled = True
+        # added to the grid coordinates, set when only a part of the world is placed (tiles, bands)
+        self.origin = (0, 0)
+        self.length = 0
+        self.coordinates = np.empty((0, 3), np.int32)
+        self.rotationIds = np.empty(0, np.uint16)
+        self.brickIds = np.empty(0, np.uint16)
+        self.shapeIds = np.empty(0, np.uint16)
+        self.scales = np.empty((0, 3), np.float32)
+        self.rotations, self.rotationIndex = [(0.0, 0.0, 0.0)], {(0.0, 0.0, 0.0): 0}
+        self.bricks, self.brickIndex = [], {}
+
+    def clear(self):
+        self.__init__()
+
+    def widen(self, name: str, i: int):
+        """
+        Makes the id column name wide enough for the id i, e.g. random z rotations times many road slopes have more
+        than 65536 rotations on big maps.
+        """
+        column = getattr(self, name)
+        if i > np.iinfo(column.dtype).max:
+            if i > np.iinfo(np.uint32).max:
+                raise OverflowError(f"more than {np.iinfo(np.uint32).max + 1} entries for {name}")
+            setattr(self, name, column.astype(np.uint32))
+
+    def brickId(self, brick) -> int:
+        i = self.brickIndex.get(brick.name)
+        if i is None:
+            i = self.brickIndex[brick.name] = len(self.bricks)
+            self.bricks.append(brick)
+            self.widen("brickIds", i)
+        return i
+
+    def rotationId(self, rotation: [float, float, float]) -> int:
+        key = (round(float(rotation[0]), KEY_DECIMALS), round(float(rotation[1]), KEY_DECIMALS),
+               round(float(rotation[2]), KEY_DECIMALS))
+        i = self.rotationIndex.get(key)
+        if i is None:
+            i = self.rotationIndex[key] = len(self.rotations)
+            self.rotations.append(key)
+            self.widen("rotationIds", i)
+        return i
+
+    def worldCoordinates(self, coordinates: (int, int, int)) -> (int, int, int):
+        """
+        :return: the grid coordinates of the placed part of the world in the whole world, see origin
+        """
+        return coordinates[0] + self.origin[0], coordinates[1] + self.origin[1], coordinates[2]
+
+    def reserve(self, amount: int):
+        """
+        Makes sure the columns have room for amount more instances.
+        """
+        needed = self.length + amount
+        if needed <= len(self.brickIds):
+            return
+        capacity = max(needed, 2 * len(self.brickIds), GROW_SIZE)
+        for name in ("coordinates", "rotationIds", "brickIds", "shapeIds", "scales"):
+            column = getattr(self, name)
+            grown = np.zeros((capacity,) + column.shape[1:], column.dtype)
+            grown[:self.length] = column[:self.length]
+            setattr(self, name, grown)
+
+    def add(self, brick, coordinates: (int, int, int), rotation: [float, float, float], shapeId: int,
+            scale: [float, float, float]):
+        """
+        :param brick: placed brick
+        :param coordinates: grid coordinates and height of the instance
+        :param rotation: rotation around x, y and z in radians
+        :param shapeId: index into the linkedObject of the brick followed by its linkedFlatObject
+        :param scale: scale in x, y and z
+        """
+        if not self.enabled:
+            return
+        self.reserve(1)
+        i = self.length
+        self.coordinates[i] = self.worldCoordinates(coordinates)
+        self.rotationIds[i] = self.rotationId(rotation)
+        self.brickIds[i] = self.brickId(brick)
+        self.shapeIds[i] = shapeId
+        self.scales[i] = scale
+        self.length += 1
+
+    def addMany(self, brick, coordinates: [(int, int, int)], rotations: [[float, float, float]], shapeIds: [int],
+                scale: [float, float, float]):
+        """
+        Same as add for many instances of one brick with the same scale.
+        """
+        if not self.enabled or not len(coordinates):
+            return
+        self.reserve(len(coordinates))
+        i, j = self.length, self.length + len(coordinates)
+        self.coordinates[i:j] = coordinates
+        self.coordinates[i:j, :2] += self.origin
+        self.rotationIds[i:j] = [self.rotationId(rotation) for rotation in rotations]
+        self.brickIds[i:j] = self.brickId(brick)
+        self.shapeIds[i:j] = shapeIds
+        self.scales[i:j] = scale
+        self.length = j
+
+    def export(self) -> dict:
+        """
+        :return: all columns cut to the number of instances, the rotation table and the names of the bricks
+        """
+        return {"coordinates": self.coordinates[:self.length], "rotationIds": self.rotationIds[:self.length],
+                "brickIds": self.brickIds[:self.length], "shapeIds": self.shapeIds[:self.length],
+                "scales": self.scales[:self.length], "rotations": np.array(self.rotations, np.float64),
+                "bricks": [brick.name for brick in self.bricks]}
+
+    def extend(self, exported: dict, bricksByName: dict):
+        """
+        Appends the instances of another store, e.g. the one of a tile.
+
+        :param exported: result of export of the other store
+        :param bricksByName: bricks of this store by their name
+        """
+        if not self.enabled or not len(exported["brickIds"]):
+            return
+        brickIds = np.array([self.brickId(bricksByName[name]) for name in exported["bricks"]], np.int64)
+        rotationIds = np.array([self.rotationId(rotation) for rotation in exported["rotations"]], np.int64)
+        amount = len(exported["brickIds"])
+        self.reserve(amount)
+        i, j = self.length, self.length + amount
+        self.coordinates[i:j] = exported["coordinates"]
+        self.rotationIds[i:j] = rotationIds[exported["rotationIds"]]
+        self.brickIds[i:j] = brickIds[exported["brickIds"]]
+        self.shapeIds[i:j] = exported["shapeIds"]
+        self.scales[i:j] = exported["scales"]
+        self.length = j
+
+    def counts(self) -> dict:
+        """
+        :return: number of instances of every brick by its name
+        """
+        counts = np.bincount(self.brickIds[:self.length], minlength=len(self.bricks))
+        return {brick.name: int(count) for brick, count in zip(self.bricks, counts)}
+
+    def footprints(self, brickId: int) -> (np.ndarray, np.ndarray, np.ndarray, np.ndarray):
+        """
+        :param brickId: index into bricks of a normal brick
+        :return: x, y and size in x and y direction of the footprint of every instance of the brick. Bricks turned by
+         90 or 270 degrees around z cover the swapped size
+        """
+        brick = self.bricks[brickId]
+        placed = self.brickIds[:self.length] == brickId
+        x, y = self.coordinates[:self.length][placed, 0], self.coordinates[:self.length][placed, 1]
+        rotations = np.array(self.rotations, np.float64)
+        quarters = np.round(rotations[self.rotationIds[:self.length][placed], 2] / (np.pi / 2)).astype(np.int64)
+        turned = quarters % 2 == 1
+        return x, y, np.where(turned, brick.size[1], brick.size[0]), np.where(turned, brick.size[0], brick.size[1])
+
+    def validate(self, worldSize: (int, int)) -> [str]:
+        """
+        Checks all instances at once: shapes have to exist, normal bricks have to lie inside the world and must not
+        overlap.
+
+        :param worldSize: size of the world in bricks
+        :return: list of the problems found, empty if there are none
+        """
+        problems = []
+        brickIds, shapeIds = self.brickIds[:self.length], self.shapeIds[:self.length]
+        coverage = np.zeros(worldSize, np.int32)
+        for i, brick in enumerate(self.bricks):
+            placed = brickIds == i
+            if not placed.any():
+                continue
+            numShapes = len(brick.linkedObject) + len(getattr(brick, "linkedFlatObject", []))
+            if (shapeIds[placed] >= numShapes).any():
+                problems.append(f"{brick.name}: {int((shapeIds[placed] >= numShapes).sum())} instances with an "
+                                f"unknown shape")
+            if getattr(brick, "brickType", "wall") not in ("flat", "slope", "road"):
+                continue
+            x, y, sizeX, sizeY = self.footprints(i)
+            outside = (x < 0) | (y < 0) | (x + sizeX > worldSize[0]) | (y + sizeY > worldSize[1])
+            if outside.any():
+                problems.append(f"{brick.name}: {int(outside.sum())} instances outside of the world")
+            x, y, sizeX, sizeY = x[~outside], y[~outside], sizeX[~outside], sizeY[~outside]
+            for deltaX in range(max(brick.size[0], brick.size[1])):
+                for deltaY in range(max(brick.size[0], brick.size[1])):
+                    inside = (deltaX < sizeX) & (deltaY < sizeY)
+                    np.add.at(coverage, (x[inside] + deltaX, y[inside] + deltaY), 1)
+        if (coverage > 1).any():
+            problems.append(f"{int((coverage > 1).sum())} cells are covered by more than one brick")
+        return problems
+
+    def topHeights(self, worldSize: (int, int), zStepSize: int) -> np.ndarray:
+        """
+        :param worldSize: size of the world in bricks
+        :param zStepSize: vertical interval of the normal bricks in heightMap depth
+        :return: int64 grid of the height of the top of the normal brick on every cell in heightMap depth, the lowest
+         int64 on cells without one
+        """
+        tops = np.full(worldSize, np.iinfo(np.int64).min, np.int64)
+        for i, brick in enumerate(self.bricks):
+            if getattr(brick, "brickType", "wall") not in ("flat", "slope", "road"):
+                continue
+            x, y, sizeX, sizeY = self.footprints(i)
+            top = self.coordinates[:self.length][self.brickIds[:self.length] == i, 2].astype(np.int64) \
+                + brick.size[2] * zStepSize
+            for deltaX in range(max(brick.size[0], brick.size[1])):
+                for deltaY in range(max(brick.size[0], brick.size[1])):
+                    inside = (deltaX < sizeX) & (deltaY < sizeY) & (x + deltaX < worldSize[0]) & \
+                             (y + deltaY < worldSize[1])
+                    tops[x[inside] + deltaX, y[inside] + deltaY] = top[inside]
+        return tops
+
+    def statistics(self) -> dict:
+        return {"placementStore": {"instances": self.length, "bricks": len(self.bricks),
+                                   "rotations": len(self.rotations),
+                                   "bytes": sum(column[:self.length].nbytes for column in
+                                                (self.coordinates, self.rotationIds, self.brickIds, self.shapeIds,
+                                                 self.scales))}}
+
+
+# shared by all bricks
+sharedPlacements = placementStore()
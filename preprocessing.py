@@ -0,0 +1,116 @@
+import numpy as np
+from maps import STRIP_ROWS
+from materials import material, materialTypeArray
+
+# candidates for the dtype of the height grid, the smallest one that fits is used
+HEIGHT_TYPES = (np.int8, np.int16, np.int32, np.int64)
+
+
+def roadMask(materialGrid: np.ndarray, materials: [material]) -> np.ndarray:
+    """
+    :param materialGrid: Grid of material indexes
+    :param materials: list of all materials
+    :return: boolean grid, True where the material is a road
+    """
+    return (materialTypeArray(materials) == "road")[materialGrid]
+
+
+def brickHeadroom(materials: [material], zStepSize: int) -> int:
+    """
+    :return: highest height a normal brick adds to the terrain in heightMap depth
+    """
+    return max([brick["size"][2] for mat in materials for brick in mat.brickTable] + [0]) * zStepSize
+
+
+def heightType(low: int, high: int, headroom: int = 0) -> type:
+    """
+    Smallest signed integer type for a height grid. Besides the heights themselves it has to hold the difference
+    between two of them (slopes) and the heights with a brick placed on top.
+
+    :param low: lowest height
+    :param high: highest height
+    :param headroom: height that is added on top of the highest height
+    """
+    low, high = min(low, low - high), max(high + headroom, high - low)
+    for dtype in HEIGHT_TYPES:
+        if np.iinfo(dtype).min <= low and high <= np.iinfo(dtype).max:
+            return dtype
+    raise OverflowError(f"heights from {low} to {high} don't fit into a 64 bit integer")
+
+
+def smoothRoads(heights: np.ndarray, isRoad: np.ndarray, radius: int) -> np.ndarray:
+    """
+    Replaces the height of every road cell with the mean height of the road cells around it, so noise in the height map
+    doesn't end up as bumps in the road.
+
+    :param heights: height grid (int64)
+    :param isRoad: boolean grid, True where the material is a road
+    :param radius: the mean is taken over a square of 2 * radius + 1 cells
+    :return: new height grid
+    """
+    def windowSums(grid: np.ndarray) -> np.ndarray:
+        # summed area table with a leading row and column of zeros
+        table = np.zeros((grid.shape[0] + 1, grid.shape[1] + 1), np.int64)
+        table[1:, 1:] = grid.cumsum(axis=0).cumsum(axis=1)
+        startX = np.clip(np.arange(grid.shape[0]) - radius, 0, grid.shape[0])[:, None]
+        endX = np.clip(np.arange(grid.shape[0]) + radius + 1, 0, grid.shape[0])[:, None]
+        startY = np.clip(np.arange(grid.shape[1]) - radius, 0, grid.shape[1])[None, :]
+        endY = np.clip(np.arange(grid.shape[1]) + radius + 1, 0, grid.shape[1])[None, :]
+        return table[endX, endY] - table[startX, endY] - table[endX, startY] + table[startX, startY]
+
+    sums = windowSums(np.where(isRoad, heights, 0))
+    counts = windowSums(isRoad.astype(np.int64))
+    # round half up, every road cell counts itself
+    means = (2 * sums + np.maximum(counts, 1)) // (2 * np.maximum(counts, 1))
+    return np.where(isRoad, means, heights)
+
+
+def preprocessHeights(displacementGrid: np.ndarray, isRoad: np.ndarray, zStepSize: int, roadSmoothing: int = 0,
+                      minHeight: int = None, maxHeight: int = None, headroom: int = 0,
+                      dtype: type = None, stripRows: int = STRIP_ROWS) -> np.ndarray:
+    """
+    Prepares the height map for placing: clamps it, smooths the roads and rounds all heights that are not roads down
+    (towards 0) to the zStepSize. The map is processed in strips of rows that are written straight into the result, so
+    besides the result only one strip is kept in 64 bit. The input is not changed.
+
+    :param displacementGrid: height map, may be read-only or memory-mapped
+    :param isRoad: boolean grid, True where the material is a road (see roadMask)
+    :param zStepSize: vertical interval of the normal bricks in heightMap depth
+    :param roadSmoothing: radius of the mean taken over the road heights, 0 to keep them
+    :param minHeight: heights below are raised to it
+    :param maxHeight: heights above are lowered to it
+    :param headroom: height that is added to the terrain later, see brickHeadroom
+    :param dtype: integer type of the result. Default: the smallest one that fits, see heightType
+    :param stripRows: number of rows that are processed at once
+    :return: new contiguous height grid
+    """
+    heights = np.asarray(displacementGrid)
+    rows = heights.shape[0]
+    exactType = dtype is None
+    if exactType:
+        # the clamped heights bound the result, rounding towards 0 and taking means never leave the range
+        low, high = (int(heights.min()), int(heights.max())) if heights.size else (0, 0)
+        if minHeight is not None:
+            low, high = max(low, minHeight), max(high, minHeight)
+        if maxHeight is not None:
+            low, high = min(low, maxHeight), min(high, maxHeight)
+        dtype = heightType(min(low, 0), max(high, 0), headroom)
+        low, high = 0, 0
+    result = np.empty(heights.shape, dtype)
+    for start in range(0, rows, stripRows):
+        end = min(start + stripRows, rows)
+        # the means of the roads reach roadSmoothing rows into the strips around
+        readStart, readEnd = max(start - roadSmoothing, 0), min(end + roadSmoothing, rows)
+        strip = heights[readStart:readEnd].astype(np.int64)
+        if minHeight is not None or maxHeight is not None:
+            np.clip(strip, minHeight, maxHeight, out=strip)
+        if roadSmoothing:
+            strip = smoothRoads(strip, isRoad[readStart:readEnd], roadSmoothing)
+        strip = strip[start - readStart:end - readStart]
+        np.subtract(strip, np.fmod(strip, zStepSize), out=strip, where=~isRoad[start:end])
+        result[start:end] = strip
+        if exactType and strip.size:
+            low, high = min(low, int(strip.min())), max(high, int(strip.max()))
+    if exactType and heightType(low, high, headroom) != dtype:
+        return result.astype(heightType(low, high, headroom))
+    return result
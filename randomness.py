@@ -0,0 +1,78 @@
+import zlib
+import numpy as np
+
+MASK32 = 0xFFFFFFFF
+# multipliers and key increments of Philox4x32-10, see Salmon et al. "Parallel random numbers: as easy as 1, 2, 3"
+PHILOX_MULTIPLIERS = (0xD2511F53, 0xCD9E8D57)
+PHILOX_INCREMENTS = (0x9E3779B9, 0xBB67AE85)
+PHILOX_ROUNDS = 10
+
+
+def philox(counter: list, key: (int, int)) -> list:
+    """
+    Philox4x32-10: a counter-based generator, the 4 random words only depend on the counter and the key, so no state
+    has to be passed from one draw to the next. Works on python ints and on uint64 arrays of 32-bit words, so single
+    draws don't pay for numpy and batches are computed at once.
+
+    :param counter: 4 words (python ints or uint64 arrays) below 2**32
+    :param key: 2 words below 2**32
+    :return: 4 random words below 2**32, of the same kind as the counter
+    """
+    c0, c1, c2, c3 = counter
+    k0, k1 = key
+    for round in range(PHILOX_ROUNDS):
+        if round:
+            k0, k1 = (k0 + PHILOX_INCREMENTS[0]) & MASK32, (k1 + PHILOX_INCREMENTS[1]) & MASK32
+        product0, product1 = c0 * PHILOX_MULTIPLIERS[0], c2 * PHILOX_MULTIPLIERS[1]
+        c0, c1, c2, c3 = (product1 >> 32) ^ c1 ^ k0, product1 & MASK32, (product0 >> 32) ^ c3 ^ k1, product0 & MASK32
+    return [c0, c1, c2, c3]
+
+
+def streamId(name: str) -> int:
+    """
+    :return: stable id of a brick for the counters, the same in every process and run
+    """
+    return zlib.crc32(name.encode())
+
+
+class placementRandom:
+    def __init__(self):
+        """
+        Random numbers of the placed instances (chosen shape, random rotation) that only depend on the seed, the
+        brick and the world coordinates of the instance: the counter of philox is x, y, z and the id of the brick and
+        the key is the seed. Every word of a draw is taken for another decision. Reordering, batching or placing in
+        tiles and bands doesn't change the output.
+        """
+        self.key = (0, 0)
+
+    def configure(self, seed: int):
+        self.key = (seed & MASK32, seed >> 32 & MASK32)
+
+    def draw(self, stream: int, coordinates: (int, int, int), bounds: [int]) -> [int]:
+        """
+        :param stream: id of the brick, see streamId
+        :param coordinates: x, y and z of the instance in the world (not in the tile)
+        :param bounds: up to 4 upper bounds, one for every decision
+        :return: one integer from 0 up to the bound for every bound
+        """
+        words = philox([int(coordinates[0]) & MASK32, int(coordinates[1]) & MASK32, int(coordinates[2]) & MASK32,
+                        stream], self.key)
+        return [words[i] * bound >> 32 for i, bound in enumerate(bounds)]
+
+    def drawMany(self, stream: int, coordinates: np.ndarray, bounds: [int]) -> np.ndarray:
+        """
+        Same as draw for many instances of one brick at once.
+
+        :param coordinates: (n, 3) array of x, y and z in the world
+        :return: (n, len(bounds)) int64 array
+        """
+        coordinates = np.asarray(coordinates, np.int64).reshape(-1, 3).astype(np.uint64) & np.uint64(MASK32)
+        stream = np.full(len(coordinates), stream, np.uint64)
+        words = philox([coordinates[:, 0], coordinates[:, 1], coordinates[:, 2], stream],
+                       (np.uint64(self.key[0]), np.uint64(self.key[1])))
+        return np.stack([(words[i] * np.uint64(bound)) >> np.uint64(32) for i, bound in enumerate(bounds)],
+                        axis=1).astype(np.int64).reshape(len(coordinates), len(bounds))
+
+
+# shared by all bricks
+sharedRandom = placementRandom()
@@ -0,0 +1,126 @@
+import heapq
+import numpy as np
+
+# scipy is optional, without it the components are found by hooking and pointer jumping (see hookComponents)
+try:
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+except ImportError:
+    connected_components = None
+
+
+def rowSegments(keyGrid: np.ndarray) -> np.ndarray:
+    """
+    :param keyGrid: 2D array of comparable keys
+    :return: id of the segment of every cell, consecutive cells of a row with the same key share one. Ids are ordered
+     by x and then y
+    """
+    starts = np.ones(keyGrid.shape, bool)
+    starts[:, 1:] = keyGrid[:, 1:] != keyGrid[:, :-1]
+    return (np.cumsum(starts.ravel()) - 1).reshape(keyGrid.shape)
+
+
+def hookComponents(numNodes: int, pairs: np.ndarray) -> np.ndarray:
+    """
+    Union-find on whole arrays: every node is hooked to the smallest label of its neighbours, then the labels are
+    shortened by pointer jumping until nothing changes.
+
+    :param numNodes: number of nodes
+    :param pairs: (n, 2) array of connected nodes
+    :return: label of every node, the smallest node of its component
+    """
+    labels = np.arange(numNodes)
+    while True:
+        smallest = np.minimum(labels[pairs[:, 0]], labels[pairs[:, 1]])
+        hooked = labels.copy()
+        np.minimum.at(hooked, labels[pairs[:, 0]], smallest)
+        np.minimum.at(hooked, labels[pairs[:, 1]], smallest)
+        while True:
+            jumped = hooked[hooked]
+            if (jumped == hooked).all():
+                break
+            hooked = jumped
+        if (hooked == labels).all():
+            return labels
+        labels = hooked
+
+
+def labelRegions(keyGrid: np.ndarray) -> (np.ndarray, int):
+    """
+    Labels the 4-connected regions of cells with the same key. Rows are split into segments first, so only the
+    segments of neighbouring rows have to be connected.
+
+    :param keyGrid: 2D array of comparable keys, e.g. height and material index
+    :return: int64 label of every cell and the number of regions. Regions are numbered by their first cell in x and
+     then y direction, with and without scipy
+    """
+    segments = rowSegments(keyGrid)
+    numSegments = int(segments[-1, -1]) + 1 if segments.size else 0
+    same = keyGrid[1:] == keyGrid[:-1]
+    # a pair is encoded into one integer, so the duplicates of the cells of two long segments are removed quickly
+    pairs = np.unique(segments[:-1][same] * numSegments + segments[1:][same])
+    pairs = np.stack(np.divmod(pairs, numSegments), axis=1).reshape(-1, 2)
+    if connected_components is not None:
+        graph = coo_matrix((np.ones(len(pairs), bool), (pairs[:, 0], pairs[:, 1])), shape=(numSegments, numSegments))
+        component = connected_components(graph, directed=False)[1]
+    else:
+        component = hookComponents(numSegments, pairs)
+    _, first, inverse = np.unique(component, return_index=True, return_inverse=True)
+    rank = np.empty(len(first), np.int64)
+    rank[np.argsort(first)] = np.arange(len(first))
+    return rank[inverse.ravel()][segments], len(first)
+
+
+class regionTable:
+    def __init__(self, keyGrid: np.ndarray):
+        """
+        Connected regions of cells with the same key, see labelRegions. For every region the key, the number of cells
+        and the bounding box (startX, endX, startY, endY) is stored, so the region can be handled on its own.
+
+        :param keyGrid: 2D array of comparable keys
+        """
+        self.labels, self.count = labelRegions(keyGrid)
+        flat = self.labels.ravel()
+        order = np.argsort(flat, kind="stable")
+        self.sizes = np.bincount(flat, minlength=self.count)
+        starts = np.concatenate(([0], np.cumsum(self.sizes)[:-1])).astype(np.int64)
+        xs, ys = np.divmod(order, keyGrid.shape[1])
+        # the cells of a region are ordered by x, so the first and the last one give its rows
+        self.boxes = np.stack((xs[starts], xs[starts + self.sizes - 1] + 1, np.minimum.reduceat(ys, starts),
+                               np.maximum.reduceat(ys, starts) + 1), axis=1) if self.count else np.empty((0, 4), int)
+        self.keys = keyGrid.ravel()[order[starts]]
+
+    def box(self, region: int) -> (slice, slice):
+        startX, endX, startY, endY = self.boxes[region]
+        return slice(startX, endX), slice(startY, endY)
+
+    def mask(self, region: int) -> np.ndarray:
+        """
+        :return: boolean mask of the cells of the region inside its bounding box
+        """
+        return self.labels[self.box(region)] == region
+
+    def largestFirst(self, regions: np.ndarray = None) -> np.ndarray:
+        """
+        :param regions: regions to order. Default: all
+        :return: the regions ordered by their number of cells, the biggest first
+        """
+        regions = np.arange(self.count) if regions is None else np.asarray(regions)
+        return regions[np.argsort(-self.sizes[regions], kind="stable")]
+
+    def schedule(self, workers: int, regions: np.ndarray = None) -> [[int]]:
+        """
+        Splits the regions into balanced batches: the biggest region is handed to the worker with the fewest cells so
+        far, then the next one.
+
+        :param workers: number of batches
+        :param regions: regions to split. Default: all
+        :return: list of regions for every worker, each ordered by size
+        """
+        batches = [[] for _ in range(workers)]
+        load = [(0, worker) for worker in range(workers)]
+        for region in self.largestFirst(regions).tolist():
+            cells, worker = heapq.heappop(load)
+            batches[worker].append(region)
+            heapq.heappush(load, (cells + int(self.sizes[region]), worker))
+        return batches
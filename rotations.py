@@ -0,0 +1,119 @@
+import math
+from collections import OrderedDict
+import numpy as np
+
+# number of distinct rotations kept in the cache
+CACHE_SIZE = 4096
+# rotations are compared after rounding to this many decimals (in radians)
+KEY_DECIMALS = 12
+
+
+def rotationMatrix(rotation: [float, float, float]) -> np.matrix:
+    """
+    :param rotation: rotation in around all axis (x,y,z) in radians
+    :return: rotation matrix, values close to 0, 1 and -1 are snapped to them
+    """
+    # X-rotation
+    matrix = np.matrix([[1, 0, 0],
+                        [0, math.cos(rotation[0]), -math.sin(rotation[0])],
+                        [0, math.sin(rotation[0]), math.cos(rotation[0])]])
+    # Y-rotation
+    matrix *= np.matrix([[math.cos(rotation[1]), 0, math.sin(rotation[1])],
+                         [0, 1, 0],
+                         [-math.sin(rotation[1]), 0, math.cos(rotation[1])]])
+    # Z-rotation
+    matrix *= np.matrix([[math.cos(rotation[2]), -math.sin(rotation[2]), 0],
+                         [math.sin(rotation[2]), math.cos(rotation[2]), 0],
+                         [0, 0, 1]])
+    matrix[abs(matrix) < 1e-8] = 0
+    matrix[matrix > 1 - 1e-8] = 1
+    matrix[matrix < -1 + 1e-8] = -1
+    return matrix
+
+
+class rotationCache:
+    def __init__(self, maxSize: int = CACHE_SIZE):
+        """
+        Least recently used cache of the formatted "rotationMatrix" entries of the items.level.json.
+
+        :param maxSize: maximum number of cached rotations
+        """
+        self.maxSize = maxSize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        self.__init__(self.maxSize)
+
+    def text(self, rotation: [float, float, float]) -> str:
+        """
+        :param rotation: rotation in around all axis (x,y,z) in radians
+        :return: '"rotationMatrix":[...],' or '' if the rotation is 0 around all axis
+        """
+        if not any(i != 0 for i in rotation):
+            return ''
+        key = (round(float(rotation[0]), KEY_DECIMALS), round(float(rotation[1]), KEY_DECIMALS),
+               round(float(rotation[2]), KEY_DECIMALS))
+        text = self.entries.get(key)
+        if text is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return text
+        self.misses += 1
+        matrix = rotationMatrix(rotation)
+        text = f'"rotationMatrix":[{matrix[0, 0]},{matrix[0, 1]},{matrix[0, 2]},' \
+               f'{matrix[1, 0]},{matrix[1, 1]},{matrix[1, 2]},' \
+               f'{matrix[2, 0]},{matrix[2, 1]},{matrix[2, 2]}],'
+        self.entries[key] = text
+        if len(self.entries) > self.maxSize:
+            self.entries.popitem(last=False)
+        return text
+
+    def statistics(self) -> dict:
+        return {"rotationCache": {"size": len(self.entries), "hits": self.hits, "misses": self.misses}}
+
+
+class roadSlopeTable:
+    def __init__(self):
+        """
+        Table of the scale and the angle a road brick needs to follow a slope.
+        """
+        self.entries = {}
+
+    def clear(self):
+        self.__init__()
+
+    def get(self, slope: int, size: int, horizontalScale: float, verticalScale: float) -> (float, float):
+        """
+        :param slope: height difference between two neighbouring cells in heightMap depth
+        :param size: size of the brick along the slope
+        :param horizontalScale: worldscale along the slope
+        :param verticalScale: worldscale in z direction (already divided by the stepSize)
+        :return: scale of the brick along the slope and the angle of the slope in radians
+        """
+        key = (int(slope), size, horizontalScale, verticalScale)
+        entry = self.entries.get(key)
+        if entry is None:
+            entry = self.entries[key] = (
+                math.sqrt((size * horizontalScale) ** 2 + (slope * verticalScale * size) ** 2) / (size * horizontalScale),
+                math.atan(slope * verticalScale / horizontalScale))
+        return entry
+
+    def precompute(self, worldscale: [float, float, float], stepSize: int, sizes: [[int, int]]):
+        """
+        Fills the table for all slopes of up to one stepSize per cell.
+
+        :param worldscale: scale of the world, worldscale[2] already divided by the stepSize
+        :param stepSize: vertical interval of the normal bricks in heightMap depth
+        :param sizes: sizes of all road bricks
+        """
+        for slope in range(-stepSize, stepSize + 1):
+            for size in sizes:
+                self.get(slope, size[0], worldscale[0], worldscale[2])
+                self.get(slope, size[1], worldscale[1], worldscale[2])
+
+
+# shared by all bricks
+sharedRotations = rotationCache()
+sharedRoadSlopes = roadSlopeTable()
@@ -0,0 +1,151 @@
+import os
+import numpy as np
+from materials import material
+from preprocessing import roadMask, brickHeadroom, heightType, preprocessHeights
+from walls import placeWalls, faceLength
+from instrumentation import sharedProfiler
+from placements import sharedPlacements
+from grids import gridState
+from maps import RAW_EXTENSIONS, mapShape, checkShapes, heightMapType, readHeightMap
+
+# folder for the maps converted to .npy files
+CACHE_DIRECTORY = "mapCache"
+
+
+def cachedArray(cachePath: str, sources: [str], shape: (int, int), dtype, fill) -> np.ndarray:
+    """
+    Returns the array stored in cachePath memory-mapped. It is (re)created with fill if it doesn't exist or one of
+    the sources changed after it was written. The new array is filled while it is memory-mapped, so it never has to
+    fit into memory, and only replaces the old file once it is complete.
+
+    :param cachePath: path of the .npy file
+    :param sources: paths of all files the array is created from
+    :param shape: shape of the array
+    :param dtype: type of the array
+    :param fill: function that writes the array into the memory-mapped array it gets
+    :return: read-only memory-mapped array
+    """
+    if not os.path.isfile(cachePath) or \
+            any(os.path.getmtime(source) > os.path.getmtime(cachePath) for source in sources):
+        os.makedirs(os.path.dirname(cachePath) or ".", exist_ok=True)
+        temporaryPath = cachePath + ".part.npy"
+        out = np.lib.format.open_memmap(temporaryPath, "w+", dtype, shape)
+        fill(out)
+        out.flush()
+        del out
+        os.replace(temporaryPath, cachePath)
+    return np.load(cachePath, mmap_mode="r")
+
+
+def prepareMaps(heightMapPath: str, textureMapPath: str, materials: [material], materialPaths: [str],
+                heightMapShape: (int, int) = None, cacheDirectory: str = CACHE_DIRECTORY) -> (np.ndarray, np.ndarray):
+    """
+    Converts the height map and the texture map once into .npy files, so they can be read band by band without
+    decoding the whole image again.
+
+    :param heightMapPath: path of the height map, .npy files and headerless heightfields are used directly (see
+     maps.readHeightMap)
+    :param textureMapPath: path of the texture map
+    :param materials: list of all materials
+    :param materialPaths: paths of the material configs, the material map is converted again if one changes
+    :param heightMapShape: shape of a headerless height map, see maps.rawShape
+    :param cacheDirectory: folder of the converted maps
+    :return: memory-mapped height map and material index map
+    :raises ValueError: if the maps differ in size
+    """
+    from main import convertToMaterial, materialIndexType
+
+    checkShapes(heightMapPath, textureMapPath, heightMapShape)
+    shape = mapShape(textureMapPath)
+    if heightMapPath.endswith((".npy",) + RAW_EXTENSIONS):
+        heightMap = readHeightMap(heightMapPath, heightMapShape)
+    else:
+        heightMap = cachedArray(os.path.join(cacheDirectory, os.path.basename(heightMapPath) + ".npy"),
+                                [heightMapPath], shape, heightMapType(heightMapPath),
+                                lambda out: readHeightMap(heightMapPath, out=out))
+    materialMap = cachedArray(os.path.join(cacheDirectory, os.path.basename(textureMapPath) + ".materials.npy"),
+                              [textureMapPath] + materialPaths, shape, materialIndexType(materials),
+                              lambda out: convertToMaterial(textureMapPath, materials, out=out))
+    return heightMap, materialMap
+
+
+def placeStreaming(heightMap: np.ndarray, materialMap: np.ndarray, materials: [material],
+                   worldScale: [float, float, float], worldOffset: [float, float, float], zStepSize: int,
+                   bandSize: int, roadSmoothing: int = 0, minHeight: int = None, maxHeight: int = None) -> int:
+    """
+    Does the same as main.place, but only keeps a band of rows in memory. The normal bricks of a band are placed first,
+    then the walls of all rows that can't change anymore. The rows that bricks of the band reach into are kept for the
+    next band, their occupancy as a bitset (see grids.gridState). The faces of the walls along x are tiled in pieces
+    (see walls.facePieces), a piece is tiled by the band it ends in, so the last rows of a band are kept too.
+
+    Every band is preprocessed when it is read (see preprocessing.preprocessHeights), together with the rows around it
+    the road smoothing needs, and stored in the same dtype for all bands. The rows the next band shares with this one
+    are kept preprocessed, so every row is read and preprocessed once. Besides the band, up to pieceLength rows before
+    it and the depth of the largest brick after it are kept in memory and tested again by the fit of the band.
+
+    :param heightMap: height map, usually memory-mapped (see prepareMaps)
+    :param materialMap: material index map, usually memory-mapped
+    :param materials: list of all materials
+    :param bandSize: number of rows in which bricks are placed at once
+    :param roadSmoothing: see preprocessing.preprocessHeights
+    :param minHeight: see preprocessing.preprocessHeights
+    :param maxHeight: see preprocessing.preprocessHeights
+    :return: number of cells at which no wall brick fit
+    """
+    from main import placeRows
+
+    size = heightMap.shape
+    depth = max([mat.maxSize[0] for mat in materials] + [1])
+    # the pieces of the walls along x reach up to pieceLength rows back into the previous band
+    pieceLength = faceLength(materials)
+    low, high = int(heightMap.min()), int(heightMap.max())
+    low = max(low, minHeight) if minHeight is not None else low
+    high = min(high, maxHeight) if maxHeight is not None else high
+    headroom = brickHeadroom(materials, zStepSize)
+    dtype = heightType(min(low, 0), max(high, 0), headroom)
+    carried = None
+    # preprocessed heights and materials of the rows the window shares with the previous one, only the rows after them
+    # are read and preprocessed
+    keptHeights, keptMaterials = np.empty((0, size[1]), dtype), np.empty((0, size[1]), materialMap.dtype)
+    holes = 0
+    for start in range(0, size[0], bandSize):
+        end = min(start + bandSize, size[0])
+        # pieceLength rows before the band for slopes, edge bricks and walls, depth rows after it for bricks reaching
+        # out of it
+        windowStart, windowEnd = max(start - pieceLength, 0), min(end + depth, size[0])
+        newStart = windowStart + len(keptHeights)
+        materialGrid = np.concatenate([keptMaterials, np.asarray(materialMap[newStart:windowEnd])])
+        readStart, readEnd = max(newStart - roadSmoothing, 0), min(windowEnd + roadSmoothing, size[0])
+        newHeights = preprocessHeights(heightMap[readStart:readEnd],
+                                       roadMask(np.asarray(materialMap[readStart:readEnd]), materials), zStepSize,
+                                       roadSmoothing, minHeight, maxHeight, dtype=dtype)
+        displacementGrid = np.concatenate([keptHeights, newHeights[newStart - readStart:windowEnd - readStart]])
+        state = gridState(displacementGrid, headroom=headroom)
+        if carried is not None:
+            state.loadRows(carried)
+        brickHeightGrid = state.heights
+        offset = [worldOffset[0] + windowStart, worldOffset[1], worldOffset[2]]
+        sharedPlacements.origin = (windowStart, 0)
+        with sharedProfiler.stage("place"):
+            placeRows(displacementGrid, materialGrid, materials, worldScale, offset, zStepSize, state.finished,
+                      brickHeightGrid, (start - windowStart, end - windowStart, 0, size[1]), False)
+
+        # all rows up to the end of the band are final now
+        with sharedProfiler.stage("walls"):
+            pairs = slice(max(start - 1, 0) - windowStart, end - windowStart)
+            sharedPlacements.origin = (max(start - 1, 0), 0)
+            holes += placeWalls(displacementGrid[pairs], brickHeightGrid[pairs], materialGrid[pairs], materials,
+                                worldScale, [worldOffset[0] + max(start - 1, 0), worldOffset[1], worldOffset[2]],
+                                zStepSize)
+            sharedPlacements.origin = (windowStart, 0)
+            holes += placeWalls(displacementGrid, brickHeightGrid, materialGrid, materials, worldScale, offset,
+                                zStepSize, True, (start - windowStart, end - windowStart))
+
+        state.packFinished()
+        state.report()
+        carried = state.carry(max(end - pieceLength, 0) - windowStart)
+        keptHeights = displacementGrid[max(end - pieceLength, 0) - windowStart:]
+        keptMaterials = materialGrid[max(end - pieceLength, 0) - windowStart:]
+        sharedProfiler.progress("place", end, size[0])
+    sharedPlacements.origin = (0, 0)
+    return holes
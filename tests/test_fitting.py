@@ -0,0 +1,89 @@
+import json
+import numpy as np
+import bricks
+import main
+from materials import material
+from fitting import fitTable
+from placements import sharedPlacements
+from rotations import sharedRotations, sharedRoadSlopes
+
+Z_STEP = 32
+# one material of every type, the slope material mixes flat and slope bricks so it is always tested per cell
+MATERIALS = {
+    "flat": {"color": [0, 146, 71], "type": "flat", "bricks": [
+        {"name": "f11", "size": [1, 1, 1]}, {"name": "f21", "size": [2, 1, 1], "rotatable": True},
+        {"name": "f22", "size": [2, 2, 1]}, {"name": "f44", "size": [4, 4, 3]}]},
+    "slope": {"color": [120, 90, 40], "type": "slope", "bricks": [
+        {"name": "s11", "size": [1, 1, 1]}, {"name": "s11s", "size": [1, 1, 1], "type": "slope", "minSlope": 1},
+        {"name": "s22", "size": [2, 2, 1]}]},
+    "road": {"color": [51, 51, 51], "type": "road", "bricks": [
+        {"name": "r11", "size": [1, 1, 1], "type": "road"}, {"name": "r22", "size": [2, 2, 1], "type": "road"},
+        {"name": "r44", "size": [4, 4, 1], "type": "road"}]},
+}
+
+
+def writeMaterials(directory) -> [str]:
+    paths = []
+    for name, config in MATERIALS.items():
+        config = dict(config, bricks=[dict(brick, persistentID="x", linkedObject=[f"/{brick['name']}.dae"])
+                                      for brick in config["bricks"]], wallBricks=[])
+        path = directory / f"{name}Material.json"
+        path.write_text(json.dumps(config))
+        paths.append(str(path))
+    return paths
+
+
+def syntheticMap(size: int = 48) -> (np.ndarray, np.ndarray):
+    """
+    :return: heights with plateaus, steps and a sloped road, and the material index of every cell
+    """
+    rng = np.random.default_rng(7)
+    x, y = np.meshgrid(np.arange(size), np.arange(size), indexing="ij")
+    heights = (rng.integers(0, 3, (size // 4, size // 4)).repeat(4, 0).repeat(4, 1) * Z_STEP).astype(np.int64)
+    heights += rng.integers(0, 2, (size, size)) * (rng.random((size, size)) < 0.1) * Z_STEP
+    materialGrid = np.zeros((size, size), np.uint8)
+    materialGrid[:, size // 3:2 * size // 3] = 1
+    materialGrid[x + y > 3 * size // 2] = 2
+    road = materialGrid == 2
+    heights[road] = (x[road] * 3 + (y[road] // 5) * 2)
+    return heights, materialGrid
+
+
+def placeAll(paths: [str], heights: np.ndarray, materialGrid: np.ndarray, fitting: bool) -> dict:
+    sharedPlacements.clear()
+    sharedRotations.clear()
+    sharedRoadSlopes.clear()
+    materials = [material(path) for path in paths]
+    finishedGrid = np.zeros(heights.shape, bool)
+    brickHeightGrid = heights.copy()
+
+    def table(*args):
+        fits = fitTable(*args)
+        if not fitting:
+            fits.supported = [False] * len(fits.supported)
+        return fits
+
+    fitTableOfMain, main.fitTable = main.fitTable, table
+    try:
+        main.placeRows(heights, materialGrid, materials, (0.25, 0.25, 0.1), (0, 0, 0), Z_STEP, finishedGrid,
+                       brickHeightGrid, (0, heights.shape[0], 0, heights.shape[1]), False)
+    finally:
+        main.fitTable = fitTableOfMain
+    placed = sharedPlacements.export()
+    placed.update(finished=finishedGrid, heights=brickHeightGrid, failedFits=[mat.failedFits for mat in materials])
+    return placed
+
+
+def test_fittingBricksPlaceLikeTestBricks(tmp_path, monkeypatch):
+    monkeypatch.setattr(bricks, "outputDirectory", str(tmp_path / "out"))
+    paths = writeMaterials(tmp_path)
+    heights, materialGrid = syntheticMap()
+    fitting = placeAll(paths, heights, materialGrid, True)
+    perCell = placeAll(paths, heights, materialGrid, False)
+    # every material type is on the map and gets bricks, flat and road through the fitTable
+    assert set(np.unique(materialGrid)) == {0, 1, 2}
+    assert {name[0] for name in fitting["bricks"]} == {"f", "s", "r"}
+    assert fitting["finished"].all()
+    assert fitting.keys() == perCell.keys()
+    for key in fitting:
+        assert np.array_equal(fitting[key], perCell[key]), key
@@ -0,0 +1,234 @@
+import os
+import pickle
+import shutil
+import tempfile
+from hashlib import sha1
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import bricks
+import packing
+from materials import material
+from configs import sharedConfigs
+from instrumentation import sharedProfiler
+from placements import sharedPlacements
+from lod import sharedLod
+from randomness import sharedRandom
+from output import readBinary, closeAll
+
+# phases of the tiled generation. They run one after another, the tiles of one phase run in parallel.
+PHASES = ("bricks", "wallsX", "wallsY")
+# part of the hash of every tile, changes whenever the stored results of the tiles change
+CACHE_VERSION = 8
+
+
+def tileAreas(size: (int, int), tileSize: int) -> [(int, int, int, int)]:
+    """
+    Splits the world into tiles.
+
+    :param size: size of the world
+    :param tileSize: length of the edges of one tile in bricks
+    :return: list of (startX, endX, startY, endY) of all tiles in row major order
+    """
+    return [(x, min(x + tileSize, size[0]), y, min(y + tileSize, size[1]))
+            for x in range(0, size[0], tileSize) for y in range(0, size[1], tileSize)]
+
+
+def tileTask(phase: str, area: (int, int, int, int), displacementGrid: np.ndarray,
+             brickHeightGrid: np.ndarray, materialGrid: np.ndarray, settings: dict) -> dict:
+    """
+    Cuts everything a worker needs for one tile out of the world grids.
+
+    Normal bricks get the tile plus a border of one cell, so slopes and edge bricks look at the same neighbours as
+    they would in the whole world. Wall bricks get the tile plus the first row (wallsX) or column (wallsY) of the next
+    tile, so every pair of neighbouring cells belongs to exactly one tile.
+    """
+    size = displacementGrid.shape
+    if phase == "bricks":
+        window = (max(area[0] - 1, 0), min(area[1] + 1, size[0]), max(area[2] - 1, 0), min(area[3] + 1, size[1]))
+    elif phase == "wallsX":
+        window = (area[0], min(area[1] + 1, size[0]), area[2], area[3])
+    else:
+        window = (area[0], area[1], area[2], min(area[3] + 1, size[1]))
+    cut = (slice(window[0], window[1]), slice(window[2], window[3]))
+    worldOffset = settings["worldOffset"]
+    task = dict(settings)
+    task.update({"phase": phase, "origin": (window[0], window[2]),
+                 "area": (area[0] - window[0], area[1] - window[0], area[2] - window[2], area[3] - window[2]),
+                 "worldOffset": [worldOffset[0] + window[0], worldOffset[1] + window[2], worldOffset[2]],
+                 "displacementGrid": displacementGrid[cut], "materialGrid": materialGrid[cut],
+                 "brickHeightGrid": None if brickHeightGrid is None else brickHeightGrid[cut]})
+    return task
+
+
+def taskHash(task: dict) -> str:
+    """
+    :param task: dictionary created by tileTask
+    :return: hash of everything the result of the task depends on, including the contents of the material configs
+    """
+    digest = sha1(str(CACHE_VERSION).encode())
+    for key in sorted(task):
+        value = task[key]
+        digest.update(key.encode())
+        if isinstance(value, np.ndarray):
+            digest.update(f'{value.dtype}{value.shape}'.encode())
+            digest.update(np.ascontiguousarray(value).tobytes())
+        else:
+            digest.update(repr(value).encode())
+    for path in task["materialPaths"]:
+        digest.update(sharedConfigs.hash(path).encode())
+    return digest.hexdigest()
+
+
+def cachedResult(cacheDirectory: str, phase: str, index: int, taskKey: str):
+    """
+    :return: result of the tile stored by an earlier run if it was placed from the same inputs, otherwise None
+    """
+    path = os.path.join(cacheDirectory, phase, f'{index}.pickle')
+    if not os.path.isfile(path):
+        return None
+    with open(path, "rb") as file:
+        entry = pickle.load(file)
+    return entry["result"] if entry["hash"] == taskKey else None
+
+
+def storeResult(cacheDirectory: str, phase: str, index: int, taskKey: str, result: dict):
+    os.makedirs(os.path.join(cacheDirectory, phase), exist_ok=True)
+    with open(os.path.join(cacheDirectory, phase, f'{index}.pickle'), "wb") as file:
+        pickle.dump({"hash": taskKey, "result": result}, file)
+
+
+def runTask(task: dict) -> dict:
+    """
+    Places the bricks of one tile in a worker process. Every task loads its own materials and writes into its own
+    temporary output folder. The random draws only depend on the seed and the world coordinates (see
+    randomness.placementRandom), so the result does not depend on which worker runs it or when.
+
+    :param task: dictionary created by tileTask
+    :return: dictionary with the output text, the binary records and the placement counters of every brick, the failed fits of every
+     material, the counters of the profiler, the exported placementStore and for the phase "bricks" the
+     brickHeightGrid of the tile
+    """
+    from main import placeBricks, placeWallBricks
+
+    directory = tempfile.mkdtemp(prefix="brickTile")
+    bricks.outputDirectory = directory
+    bricks.outputFormats = task["outputFormats"]
+    # the output of the tile is read back as text and compressed when it is merged
+    bricks.outputCompression = None
+    packing.packingMode = task["packingMode"]
+    # the tiles already run in parallel
+    packing.packingProcesses = 1
+    sharedLod.enabled = False
+    if task["lod"]:
+        sharedLod.configure(**task["lod"])
+    try:
+        materials = [material(path) for path in task["materialPaths"]]
+        displacementGrid, materialGrid = task["displacementGrid"], task["materialGrid"]
+        sharedRandom.configure(task["seed"])
+        # workers run many tasks, only count and store the ones of this task
+        sharedProfiler.counters = {}
+        sharedPlacements.clear()
+        sharedPlacements.origin = task["origin"]
+        result = {}
+        if task["phase"] == "bricks":
+            area = task["area"]
+            brickHeightGrid = placeBricks(displacementGrid, materialGrid, materials, task["worldScale"],
+                                          task["worldOffset"], task["zStepSize"], area)
+            result["brickHeightGrid"] = brickHeightGrid[area[0]:area[1], area[2]:area[3]]
+        else:
+            placeWallBricks(displacementGrid, task["brickHeightGrid"], displacementGrid.shape, task["worldScale"],
+                            task["worldOffset"], task["zStepSize"], materialGrid, materials,
+                            task["phase"] == "wallsY")
+
+        result["output"], result["records"], result["counters"] = {}, {}, {}
+        result["failedFits"] = {mat.name: mat.failedFits for mat in materials}
+        result["profilerCounters"] = sharedProfiler.counters
+        result["profilerPeaks"] = sorted(sharedProfiler.peaks)
+        result["placements"] = sharedPlacements.export()
+        closeAll([brick.sink for mat in materials for brick in mat.builtBrickList()])
+        for mat in materials:
+            for brick in mat.builtBrickList():
+                if brick.sink.numInstances and "json" in task["outputFormats"]:
+                    with open(os.path.join(directory, brick.name, "items.level.json")) as file:
+                        result["output"][brick.name] = file.read()
+                if brick.sink.numInstances and "binary" in task["outputFormats"]:
+                    records, tables = readBinary(os.path.join(directory, brick.name))
+                    result["records"][brick.name] = (np.array(records), tables)
+                result["counters"][brick.name] = (brick.placedBricks, getattr(brick, "placedEdgeBricks", 0),
+                                                  getattr(brick, "placedFlatBricks", 0),
+                                                  getattr(brick, "triedBricks", 0))
+        return result
+    finally:
+        shutil.rmtree(directory)
+
+
+def placeTiled(displacementGrid: np.ndarray, materialGrid: np.ndarray, materials: [material], materialPaths: [str],
+               worldScale: [float, float, float], worldOffset: [float, float, float], zStepSize: int, tileSize: int,
+               seed: int = 0, processes: int = None, cacheDirectory: str = None) -> np.ndarray:
+    """
+    Does the same as main.place, but splits the world into tiles that are placed in parallel. Bricks never cross the
+    border of their tile, walls between two tiles are placed by the tile in front of the border. The output of all
+    tiles is appended to the items.level.json files of the given materials in tile order, so it only depends on the
+    seed and the tile size.
+
+    :param materialPaths: paths of the material configs, needed to load the materials in the worker processes
+    :param tileSize: length of the edges of one tile in bricks
+    :param seed: seed of the random draws, see randomness.placementRandom
+    :param processes: number of worker processes. Default: number of cores
+    :param cacheDirectory: if given, the result of every tile is stored in this folder together with a hash of its
+     inputs. Tiles whose inputs didn't change since the last run are not placed again, their stored output is used.
+     Because a tile also sees the border of its neighbours, editing a cell next to a border re-places both tiles.
+    :return: brickHeightGrid: height of the terrain with all bricks placed
+    """
+    areas = tileAreas(displacementGrid.shape, tileSize)
+    settings = {"materialPaths": materialPaths, "worldScale": worldScale, "worldOffset": worldOffset,
+                "zStepSize": zStepSize, "seed": seed, "outputFormats": bricks.outputFormats,
+                "packingMode": packing.packingMode, "lod": sharedLod.settings() if sharedLod.enabled else None}
+    # the bricks of a material are only built once a tile reports them
+    brickMaterials = {brick["name"]: mat for mat in materials for brick in mat.brickTable + mat.wallBrickTable}
+    bricksByName = {}
+    materialsByName = {mat.name: mat for mat in materials}
+    brickHeightGrid = None
+
+    with ProcessPoolExecutor(processes) as executor:
+        for phase in PHASES:
+            with sharedProfiler.stage("place" if phase == "bricks" else "walls"):
+                tasks = [tileTask(phase, area, displacementGrid, brickHeightGrid, materialGrid, settings)
+                         for area in areas]
+                if cacheDirectory is None:
+                    results = list(executor.map(runTask, tasks))
+                else:
+                    keys = [taskHash(task) for task in tasks]
+                    results = [cachedResult(cacheDirectory, phase, i, keys[i]) for i in range(len(tasks))]
+                    dirty = [i for i in range(len(tasks)) if results[i] is None]
+                    for i, result in zip(dirty, executor.map(runTask, [tasks[i] for i in dirty])):
+                        storeResult(cacheDirectory, phase, i, keys[i], result)
+                        results[i] = result
+                    sharedProfiler.count("changedTiles", len(dirty))
+                    sharedProfiler.log(f'{phase}: {len(dirty)} of {len(tasks)} tiles changed')
+                if phase == "bricks":
+                    brickHeightGrid = np.copy(displacementGrid)
+                    for area, result in zip(areas, results):
+                        brickHeightGrid[area[0]:area[1], area[2]:area[3]] = result["brickHeightGrid"]
+                # merge in tile order
+                for result in results:
+                    for name in result["counters"]:
+                        if name not in bricksByName:
+                            mat = brickMaterials[name]
+                            bricksByName.update({brick.name: brick for brick in mat.bricks + mat.wallBricks})
+                    for name, text in result["output"].items():
+                        bricksByName[name].sink.write(text)
+                    for name, (records, tables) in result["records"].items():
+                        bricksByName[name].sink.writeRecords(records, tables)
+                    for name, (placed, edge, flat, tried) in result["counters"].items():
+                        brick = bricksByName[name]
+                        brick.placedBricks += placed
+                        if hasattr(brick, "placedEdgeBricks"):
+                            brick.placedEdgeBricks += edge
+                            brick.placedFlatBricks += flat
+                            brick.triedBricks += tried
+                    for name, failed in result["failedFits"].items():
+                        materialsByName[name].failedFits += failed
+                    sharedProfiler.merge(result["profilerCounters"], result["profilerPeaks"])
+                    sharedPlacements.extend(result["placements"], bricksByName)
+    return brickHeightGrid
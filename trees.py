@@ -1,4 +1,6 @@
+from concurrent.futures import ProcessPoolExecutor
 from bricks import normalBrick
+from fitting import uniformMask
 import numpy as np
 
 class treeType:
@@ -9,3 +11,115 @@ class treeType:
         self.density = data["density"]
         self.color = np.array(data["color"], np.uint8).tobytes()
         #self.maxRandom = data.get("maxRandom", (int(self.density[0]/2), int(self.density[1]/2)))
+
+
+def treeCandidates(worldSize: (int, int), density: (int, int), rng: np.random.Generator) -> (np.ndarray, np.ndarray):
+    """
+    One jittered candidate in every cell of the density grid, candidates that fall off the map are dropped.
+
+    :param worldSize: size of the world in bricks
+    :param density: size of a cell of the density grid
+    :param rng: random generator of the tree type
+    :return: x and y coordinates of the candidates, ordered by x and then y
+    """
+    xs, ys = np.meshgrid(np.arange(0, worldSize[0], density[0]), np.arange(0, worldSize[1], density[1]),
+                         indexing="ij")
+    xs = xs + rng.integers(0, density[0], xs.shape)
+    ys = ys + rng.integers(0, density[1], ys.shape)
+    inside = (xs < worldSize[0]) & (ys < worldSize[1])
+    return xs[inside], ys[inside]
+
+
+def footprintMasks(heightGrid: np.ndarray, freeGrid: np.ndarray, sizes: [(int, int)]) -> {(int, int): np.ndarray}:
+    """
+    For every tree size a mask of the cells a tree can be anchored at: the whole footprint lies inside the world, is
+    flat and free (like normalBrick.treeTest).
+
+    :param heightGrid: height of the terrain
+    :param freeGrid: boolean grid, False where no tree may stand
+    :param sizes: sizes of the trees in x and y direction
+    """
+    masks = {}
+    for size in set(sizes):
+        masks[size] = uniformMask(heightGrid, size) & uniformMask(freeGrid, size) & freeGrid
+    return masks
+
+
+def placeTreeType(index: int, density: (int, int), sizes: [(int, int)], heightGrid: np.ndarray,
+                  treeTypeGrid: np.ndarray, freeGrid: np.ndarray, seed: int = 0) -> np.ndarray:
+    """
+    Places all trees of one tree type. All random numbers are drawn at once from a generator seeded with the seed
+    and the index of the tree type, so the result is the same no matter in which order or process the tree types are
+    placed. Every candidate tests the trees in a random order and takes the first one that fits and doesn't overlap
+    a tree placed before.
+
+    :param index: index of the tree type, the value of its cells in treeTypeGrid
+    :param density: size of a cell of the density grid, every cell gets at most one tree
+    :param sizes: size of every tree of the tree type in x and y direction
+    :param heightGrid: height of the terrain
+    :param treeTypeGrid: grid of tree type indexes
+    :param freeGrid: boolean grid, False where no tree may stand
+    :param seed: seed of the random generator
+    :return: int64 array with one row of x, y, index of the tree and rotation in degrees per placed tree
+    """
+    if not sizes:
+        return np.empty((0, 4), np.int64)
+    rng = np.random.default_rng([seed, index])
+    xs, ys = treeCandidates(heightGrid.shape, density, rng)
+    # drawn for every candidate, so the numbers of a cell don't depend on the tree types of the other cells
+    orders = rng.random((len(xs), len(sizes))).argsort(axis=1)
+    rotations = rng.integers(0, 4, len(xs)) * 90
+    inType = treeTypeGrid[xs, ys] == index
+    xs, ys, orders, rotations = xs[inType], ys[inType], orders[inType], rotations[inType]
+
+    masks = footprintMasks(heightGrid, freeGrid, sizes)
+    fits = np.stack([masks[size][xs, ys] for size in sizes], axis=1)
+    fits = np.take_along_axis(fits, orders, axis=1)
+
+    occupied = np.zeros(heightGrid.shape, bool)
+    placed = []
+    for i in np.flatnonzero(fits.any(axis=1)):
+        x, y = xs[i], ys[i]
+        for r in orders[i][fits[i]]:
+            sizeX, sizeY = sizes[r][0], sizes[r][1]
+            if not occupied[x:x + sizeX, y:y + sizeY].any():
+                occupied[x:x + sizeX, y:y + sizeY] = True
+                placed.append((x, y, r, rotations[i]))
+                break
+    return np.array(placed, np.int64).reshape(-1, 4)
+
+
+def placeForest(heightGrid: np.ndarray, treeTypeGrid: np.ndarray, trees: [treeType],
+                occupiedGrid: np.ndarray = None, seed: int = 0, processes: int = None) -> [np.ndarray]:
+    """
+    Places the trees of all tree types, in parallel if processes is more than 1. Trees of a tree type that overlap a
+    tree of an earlier tree type are dropped, so trees never overlap each other.
+
+    :param heightGrid: height of the terrain the trees stand on
+    :param treeTypeGrid: grid of tree type indexes
+    :param trees: all tree types
+    :param occupiedGrid: boolean grid, True where no tree may stand (e.g. roads). Default: nothing is occupied
+    :param seed: seed of the random generator, see placeTreeType
+    :param processes: number of processes. Default: 1
+    :return: placed trees of every tree type, see placeTreeType
+    """
+    heightGrid, treeTypeGrid = np.asarray(heightGrid), np.asarray(treeTypeGrid)
+    freeGrid = np.ones(heightGrid.shape, bool) if occupiedGrid is None else ~np.asarray(occupiedGrid, bool)
+    arguments = (range(len(trees)), [tree.density for tree in trees],
+                 [[tuple(brick.size[:2]) for brick in tree.trees] for tree in trees],
+                 [heightGrid] * len(trees), [treeTypeGrid] * len(trees), [freeGrid] * len(trees), [seed] * len(trees))
+    if processes and processes > 1 and len(trees) > 1:
+        with ProcessPoolExecutor(min(processes, len(trees))) as executor:
+            results = list(executor.map(placeTreeType, *arguments))
+    else:
+        results = list(map(placeTreeType, *arguments))
+
+    occupied = np.zeros(heightGrid.shape, bool)
+    for index, (tree, placed) in enumerate(zip(trees, results)):
+        sizes = np.array([tree.trees[r].size[:2] for r in range(tree.numTrees)], np.int64).reshape(-1, 2)
+        # trees of the same type never overlap, so all of them are tested before they are marked
+        keep = np.array([not occupied[x:x + sizes[r][0], y:y + sizes[r][1]].any() for x, y, r, _ in placed], bool)
+        results[index] = placed = placed[keep]
+        for x, y, r, _ in placed:
+            occupied[x:x + sizes[r][0], y:y + sizes[r][1]] = True
+    return results
@@ -0,0 +1,246 @@
+import math
+import numpy as np
+from instrumentation import sharedProfiler
+from placements import sharedPlacements
+from randomness import sharedRandom
+
+# number of rows whose wall masks are computed at once, see wallRows
+WALL_BLOCK_ROWS = 256
+# faces are tiled in pieces of this many cells along the edge, aligned to the world, see facePieces
+WALL_FACE_LENGTH = 64
+
+
+def wallChoices(mat) -> [[object]]:
+    """
+    :param mat: material
+    :return: for every width of the wall bricks of the material its wall bricks of every height (the last one if more
+     are as tall), widest first and tallest first. Wall bricks without width or height are never placed.
+    """
+    bySize = {}
+    for brick in mat.wallBricks:
+        width, height = brick.size[0], brick.size[2]
+        if width > 0 and height > 0:
+            bySize[width, height] = brick
+    return [[bySize[size] for size in sorted(bySize, key=lambda size: -size[1]) if size[0] == width]
+            for width in sorted({size[0] for size in bySize}, reverse=True)]
+
+
+def pickHeight(options: [object], depths: [int], zStepSize: int) -> object:
+    """
+    :param options: wall bricks of the same width, tallest first, see wallChoices
+    :param depths: height of the face that is still open under every covered cell, 0 or less if it is closed
+    :return: the tallest wall brick that doesn't reach below the face of any covered cell, the shortest if all do
+    """
+    remaining = [depth for depth in depths if depth > 0]
+    depth = min(remaining) if remaining else 0
+    for brick in options:
+        if brick.size[2] * zStepSize <= depth:
+            return brick
+    return options[-1]
+
+
+def faceLength(materials: list) -> int:
+    """
+    :return: length of the pieces the faces are tiled in, at least as long as the widest wall brick
+    """
+    return max([WALL_FACE_LENGTH] + [brick["size"][0] for mat in materials for brick in mat.wallBrickTable])
+
+
+def facePieces(start: int, end: int, total: int, offset: int, length: int) -> [(int, int)]:
+    """
+    Splits the cells along an edge into the pieces the faces are tiled in. Pieces start at the multiples of length in
+    the world, so every mode (normal, tiled, banded) tiles the same pieces.
+
+    :param start: only pieces that end after start are returned
+    :param end: only pieces that end at end or before are returned
+    :param total: number of cells along the edge
+    :param offset: position of the first cell in the world
+    :param length: see faceLength
+    :return: first and last (exclusive) cell of every piece
+    """
+    bounds = sorted({0, total} | set(range(-offset % length, total, length)))
+    return [(first, last) for first, last in zip(bounds, bounds[1:]) if start < last <= end]
+
+
+def tileRun(depths: [int], choices: [[object]], zStepSize: int) -> ([(int, object)], [int]):
+    """
+    Covers a run of cells at the same height and of the same material with wall bricks side by side. The fewest holes
+    come first, then the fewest bricks, then the most covered cells; if more coverings are equal wider bricks are
+    placed first. Of the bricks of the chosen width the tallest one that fits into the face is placed, see pickHeight.
+
+    :param depths: height of the face that is still open under every cell of the run. Cells with 0 or less don't need
+     a wall, they may be covered if that saves a brick
+    :param choices: wall bricks of the material by width, see wallChoices
+    :param zStepSize: vertical interval of the bricks in heightMap depth
+    :return: position in the run and wall brick of every brick, position of every needed cell that is left as a hole
+    """
+    needed = [depth > 0 for depth in depths]
+    length = len(needed)
+    # (holes, bricks, -covered cells) of the cells from the index on and the brick placed there, None: left empty
+    best = [(0, 0, 0)] * (length + 1)
+    chosen = [None] * (length + 1)
+    for i in range(length - 1, -1, -1):
+        rest = best[i + 1]
+        best[i], chosen[i] = (rest[0] + needed[i], rest[1], rest[2]), None
+        for options in choices:
+            width = options[0].size[0]
+            if i + width <= length:
+                rest = best[i + width]
+                if (rest[0], rest[1] + 1, rest[2] - width) < best[i]:
+                    best[i], chosen[i] = (rest[0], rest[1] + 1, rest[2] - width), options
+    bricks, holes = [], []
+    i = 0
+    while i < length:
+        if chosen[i] is None:
+            if needed[i]:
+                holes.append(i)
+            i += 1
+        else:
+            width = chosen[i][0].size[0]
+            bricks.append((i, pickHeight(chosen[i], depths[i:i + width], zStepSize)))
+            i += width
+    return bricks, holes
+
+
+def tileFace(tops: list, bottoms: list, materialRow: list, choices: list, start: int, end: int,
+             zStepSize: int) -> ([(int, int, object)], [int]):
+    """
+    Tiles one face of a piece of an edge. The face is the cells along the edge times the height bands from the top of
+    the terrain of every cell down to the top of the bricks on the other side. It is swept from the highest band down:
+    the cells whose remaining top is at the current height form runs of the same material, every run is covered by
+    tileRun and the covered cells are lowered by the height of their brick. Cells of the same height that don't need a
+    wall anymore may be covered too. A needed cell no brick fits is a hole, it is lowered by one band.
+
+    :param tops: top of the face of every cell, lowered while the face is tiled
+    :param bottoms: bottom of the face of every cell
+    :param materialRow: material index of every cell
+    :param choices: wall bricks of every material, see wallChoices. Empty for materials without wall bricks
+    :param start: first cell of the piece
+    :param end: last cell of the piece (exclusive)
+    :param zStepSize: vertical interval of the bricks in heightMap depth
+    :return: cell, height and wall brick of every brick, material index of every hole
+    """
+    placed, holes = [], []
+    cells = [y for y in range(start, end) if choices[materialRow[y]]]
+    while True:
+        cells = [y for y in cells if tops[y] > bottoms[y]]
+        if not cells:
+            return placed, holes
+        height = max(tops[y] for y in cells)
+        y = start
+        while y < end:
+            if tops[y] != height or not choices[materialRow[y]]:
+                y += 1
+                continue
+            runEnd = y + 1
+            while runEnd < end and tops[runEnd] == height and materialRow[runEnd] == materialRow[y]:
+                runEnd += 1
+            bricks, runHoles = tileRun([tops[i] - bottoms[i] for i in range(y, runEnd)], choices[materialRow[y]],
+                                       zStepSize)
+            for position, brick in bricks:
+                placed.append((y + position, height, brick))
+                for i in range(y + position, y + position + brick.size[0]):
+                    tops[i] -= brick.size[2] * zStepSize
+            for position in runHoles:
+                holes.append(materialRow[y])
+                tops[y + position] -= zStepSize
+            y = runEnd
+
+
+def wallRows(displacementGrid: np.ndarray, brickHeightGrid: np.ndarray, materialGrid: np.ndarray,
+             hasWalls: np.ndarray, start: int, end: int):
+    """
+    Finds the rows that need walls. The masks are computed for WALL_BLOCK_ROWS rows at a time, so they stay small
+    and the grids are only read, never copied.
+
+    :param hasWalls: boolean array, True for the index of every material with wall bricks
+    :param start: first cell along the rows that is tiled
+    :param end: last cell along the rows that is tiled (exclusive)
+    :return: generator of every row x with its front and back mask of the cells along the row
+    """
+    numRows = materialGrid.shape[0] - 1
+    for blockStart in range(0, numRows, WALL_BLOCK_ROWS):
+        block = slice(blockStart, min(blockStart + WALL_BLOCK_ROWS, numRows))
+        nextBlock = slice(block.start + 1, block.stop + 1)
+        walled = hasWalls[materialGrid[block]]
+        front = (displacementGrid[block] > brickHeightGrid[nextBlock]) & walled
+        back = (displacementGrid[nextBlock] > brickHeightGrid[block]) & walled
+        active = (front | back)[:, start:end]
+        for x in (blockStart + np.flatnonzero(active.any(axis=1))).tolist():
+            yield x, front[x - blockStart], back[x - blockStart]
+
+
+def placeWalls(displacementGrid: np.ndarray, brickHeightGrid: np.ndarray, materialGrid: np.ndarray, materials: list,
+               worldScale: [float, float, float], worldOffset: [float, float, float], zStepSize: int,
+               LOCALXAXIS: bool = False, span: (int, int) = None) -> int:
+    """
+    Places wall bricks wherever the terrain of a cell is higher than the top of the bricks of the next cell in
+    x-direction (or y-direction if LOCALXAXIS), so no holes appear between them. The material of the first cell of
+    both decides which wall bricks are used, for both faces.
+
+    The rows that need walls are found for blocks of rows at once (see wallRows), only those are visited. Both faces
+    of a row are split into pieces along the row (see facePieces) and every piece is tiled with as few wall bricks as
+    possible, see tileFace. Holes are counted per material instead of being reported one by one.
+
+    :param displacementGrid: Grid that stores the height of the terrain
+    :param brickHeightGrid: height of the terrain with all normal bricks placed
+    :param materialGrid: Grid of material indexes
+    :param materials: list of all materials
+    :param LOCALXAXIS: False: walls between rows, True: walls between columns
+    :param span: if given, only the pieces that end after the first and not after the second cell along the rows
+     (columns if LOCALXAXIS) are tiled. Used to place the walls in parts, the pieces have to lie inside the grids.
+    :return: number of cells of the faces at which no wall brick fit
+    """
+    if LOCALXAXIS:
+        # transposed views, so the same code works for both directions
+        displacementGrid, brickHeightGrid, materialGrid = displacementGrid.T, brickHeightGrid.T, materialGrid.T
+    hasWalls = np.array([not mat.noWallBrick for mat in materials])
+    total = materialGrid.shape[1]
+    span = span or (0, total)
+    pieces = facePieces(span[0], span[1], total, sharedPlacements.origin[0 if LOCALXAXIS else 1],
+                        faceLength(materials))
+    if not pieces:
+        return 0
+    # the wall bricks are only built for the materials on the map
+    present = np.bincount(np.ravel(materialGrid, order="K"), minlength=len(materials)) > 0
+    choices = [wallChoices(mat) if present[i] and not mat.noWallBrick else [] for i, mat in enumerate(materials)]
+    rotations = (math.radians(90 * LOCALXAXIS), math.radians(90 * LOCALXAXIS + 180))
+    holes = [0] * len(materials)
+
+    for x, front, back in wallRows(displacementGrid, brickHeightGrid, materialGrid, hasWalls, pieces[0][0],
+                                   pieces[-1][1]):
+        materialRow = materialGrid[x].tolist()
+        placements = {}
+        # front: from the terrain of x down to the bricks of x + 1, back: the other way round
+        for mask, tops, bottoms, BACKFACING in ((front, displacementGrid[x], brickHeightGrid[x + 1], False),
+                                                (back, displacementGrid[x + 1], brickHeightGrid[x], True)):
+            tops, bottoms = tops.tolist(), bottoms.tolist()
+            for start, end in pieces:
+                if not mask[start:end].any():
+                    continue
+                placed, faceHoles = tileFace(tops, bottoms, materialRow, choices, start, end, zStepSize)
+                for index in faceHoles:
+                    holes[index] += 1
+                for y, height, brick in placed:
+                    coordinates = (x + BACKFACING, y) if not LOCALXAXIS else (y, x + BACKFACING)
+                    entry = placements.setdefault(brick.name, (brick, [], []))
+                    entry[1].append((coordinates[0], coordinates[1], height))
+                    entry[2].append(rotations[BACKFACING])
+
+        for brick, coordinates, zRotations in placements.values():
+            # the shapes of all instances of the brick in the row are drawn at once
+            shapes = [0] * len(coordinates)
+            if len(brick.linkedObject) > 1:
+                shapes = sharedRandom.drawMany(brick.stream, np.array(coordinates) + (*sharedPlacements.origin, 0),
+                                               (len(brick.linkedObject),))[:, 0].tolist()
+            rotationsXYZ = [[0, 0, z] for z in zRotations]
+            sharedPlacements.addMany(brick, coordinates, rotationsXYZ, shapes, brick.scale)
+            brick.placeInstances([(x + worldOffset[0], y + worldOffset[1], z + worldOffset[2])
+                                  for x, y, z in coordinates], worldScale, rotationsXYZ,
+                                 [brick.linkedObject[shape] for shape in shapes])
+    if sum(holes):
+        sharedProfiler.log(f'walls along {"y" if LOCALXAXIS else "x"}: no matching wall brick for ' +
+                           ", ".join(f'{holes[i]} cells of {materials[i].name}' for i in range(len(materials))
+                                     if holes[i]))
+    sharedProfiler.count("wallHoles", sum(holes))
+    return sum(holes)